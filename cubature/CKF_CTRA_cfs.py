@@ -5,13 +5,31 @@
 # measurement matrix:               2D noisy x-y position measured directly, yaw rate, acceleration, velocity (5 x 1)
 
 import math
-import matplotlib.pyplot as plt
+import os
+import sys
 import numpy as np
 from scipy.linalg import sqrtm
-import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from others import cubature_transform as ckf
+from others.square_root_cubature import sqrt_cubature_prediction, sqrt_cubature_update
+from others.measurements import load_columns, measurement_matrix
+from others.motion_models import ctra, ctra_linear, chord, arc_states, chord_states
+from others.trajectory import Trajectory
+from others.rts_smoother import cubature_rts_smoother
+from others.filter_step import Workspace, cubature_step
+
+# headless runs never import matplotlib or plot, pass --plot to show figures
+headless = '--plot' not in sys.argv[1:]
+if not headless:
+    import matplotlib.pyplot as plt
 
 # initalize global variables
-cfs = pd.read_csv('cfs_data_fsn17.csv')
+cfs = load_columns('cfs_data_fsn17.csv', ['XX', 'YY', 'tv_velocity', 'GPSVel', 'yawRate', 'ax', 'ay'])
+cfs['a_x'] = cfs['ax'] - 1.0
+cfs['acc'] = np.sqrt(cfs['a_x']**2 + cfs['ay']**2)
+z_all = measurement_matrix(cfs, ['XX', 'YY', 'GPSVel', 'yawRate', 'a_x'])
+vel_all = cfs['tv_velocity']
 dt = 0.01                                                       # seconds
 # N = int(len(cfs['XX']))-1                                    # number of samples
 N = 5000
@@ -21,7 +39,7 @@ x_0 = np.array([[0.0],                                  # x position    [m]
                 [0.0],                                  # y position    [m]
                 [1e-6],                                 # yaw           [rad]
                 [1e-6],                                 # velocity      [m/s]
-                [1e-6],                                 # yaw rate      [rad/s]
+                [0.0],                                  # yaw rate      [rad/s]
                 [1e-6]])                                # acceleration  [m/s^2]
 
 
@@ -56,148 +74,149 @@ r = np.array([[0.015, 0.0, 0.0, 0.0, 0.0],
               [0.0, 0.0, 0.0, 0.01, 0.0],
               [0.0, 0.0, 0.0, 0.0, 0.01]])**2
 
+# square roots of q and r for the square root cubature kalman filter
+sq = np.linalg.cholesky(q)
+sr = np.linalg.cholesky(r)
+
+# cubature rule of the covariance filter, 'third', 'fifth' or 'gauss_hermite',
+# the square root filter always uses the third degree rule
+rule = 'third'
+
+# the motion model as its linear part plus the chord over yaw, velocity and yaw rate,
+# built once for the partially nonlinear prediction, which uses the third degree rule
+partial_model = ckf.PartialModel(ctra_linear(dt), arc_states, chord_states,
+                                 lambda yaw, v, w: chord(yaw, v, w, dt))
+
 
 # main program
 def main():
-    # show_final = int(input('Display final result? (No/Yes = 0/1) : '))
-    # show_animation = int(
-    # input('Show animation of filter working? (No/Yes = 0/1) : '))
-    # if show_animation == 1:
-    # show_ellipse = int(
-    # input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
-    # else:
-    # show_ellipse = 0
-    show_final = 1
-    show_animation = 0
-    show_ellipse = 0
+    if headless:
+        show_final = 0
+        show_animation = 0
+        show_ellipse = 0
+    else:
+        show_final = int(input('Display final result? (No/Yes = 0/1) : '))
+        show_animation = int(
+            input('Show animation of filter working? (No/Yes = 0/1) : '))
+        if show_animation == 1:
+            show_ellipse = int(
+                input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
+        else:
+            show_ellipse = 0
+    square_root = 0
+    smooth = 0
+    # cubature over yaw, velocity and yaw rate only, the other states are linear
+    partial = 0
+    # the step writes into preallocated buffers and overwrites x_est and p_est,
+    # it has no smoother record and no partial prediction
+    preallocate = 0
     x_est = x_0
     p_est = p_0
+    workspace = None
+    if preallocate == 1 and square_root == 0:
+        workspace = Workspace(np.shape(hx)[1], np.shape(hx)[0], rule, hx)
+        x_est, p_est = x_0.copy(), p_0.copy()
+    s_est = np.linalg.cholesky(p_0)
     # x_true = x_0
     # p_true = p_0
     # x_true_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    x_est_cat = np.array(
-        [x_0[0, 0], x_0[1, 0], x_0[2, 0], x_0[3, 0], x_0[4, 0], x_0[5, 0]])
-    z_cat = np.array([x_0[0, 0], x_0[1, 0], x_0[3, 0], x_0[4, 0], x_0[5, 0]])
-    vel_cat = np.array([x_0[3, 0]])
-    lat_vel_cat = np.array([x_0[3, 0]])
+    trajectory = Trajectory([('x', 6), ('z', 5), ('vel', 1), ('lat_vel', 1)], N + 1)
+    trajectory.append(x=x_0, z=x_0[[0, 1, 3, 4, 5]], vel=x_0[3], lat_vel=x_0[3])
+    # forward moments for the smoother, row 0 is the prior, only the covariance
+    # filter records them so smoothing is off in the square root and preallocated modes
+    store = None
+    if smooth == 1 and square_root == 0 and workspace is None:
+        store = Trajectory([('x_pred', 6), ('p_pred', (6, 6)), ('x_filt', 6), ('p_filt', (6, 6)),
+                            ('cross', (6, 6))], N + 1)
+        store.append(x_pred=x_0, p_pred=p_0, x_filt=x_0, p_filt=p_0, cross=p_0)
     for i in range(N):
         # x_true, p_true = extended_prediction(x_true, p_true)
         z, vel = gen_measurement(i)
-        if i == (N - 1) and show_final == 1:
-            show_final_flag = 1
-        else:
-            show_final_flag = 0
         # x_true_cat = np.vstack((x_true_cat, np.transpose(x_true[0:2])))
-        z_cat = np.vstack((z_cat, np.transpose(z[0:5])))
         # vel_cat = np.vstack((vel_cat, vel * np.sin(x_est[2])))
-        vel_cat = np.vstack((vel_cat, vel))
-        lat_vel_cat = np.vstack((lat_vel_cat, x_est[3] * np.cos(x_est[2])))
-        x_est_cat = np.vstack((x_est_cat, np.transpose(x_est[0:6])))
-        postpross(i, x_est, p_est, x_est_cat, z,
-                  z_cat, vel_cat, lat_vel_cat, show_animation, show_ellipse, show_final_flag)
-        x_est, p_est = cubature_kalman_filter(x_est, p_est, z)
+        trajectory.append(x=x_est, z=z, vel=vel,
+                          lat_vel=x_est[3] * np.cos(x_est[2]))
+        if show_animation == 1:
+            postpross(i, x_est, p_est, trajectory['x'], z, trajectory['z'],
+                      trajectory['vel'], trajectory['lat_vel'], show_animation, show_ellipse, 0)
+        if square_root == 1:
+            x_est, s_est = square_root_cubature_kalman_filter(x_est, s_est, z)
+            if show_ellipse == 1:
+                p_est = s_est @ np.transpose(s_est)
+        elif workspace is not None:
+            cubature_step(workspace, x_est, p_est, z, f, q, hx, r)
+        else:
+            x_est, p_est = cubature_kalman_filter(x_est, p_est, z, store, partial)
+    x_smooth = None
+    if store is not None:
+        x_smooth, p_smooth = cubature_rts_smoother(store['x_pred'], store['p_pred'],
+                                                   store['x_filt'], store['p_filt'], store['cross'])
+    if show_final == 1:
+        postpross(N - 1, x_est, p_est, trajectory['x'], z, trajectory['z'],
+                  trajectory['vel'], trajectory['lat_vel'], 0, 0, 1, x_smooth)
     print('CKF Over')
 
 
-# cubature kalman filter
-def cubature_kalman_filter(x_est, p_est, z):
-    x_pred, p_pred = cubature_prediction(x_est, p_est)
+# cubature kalman filter, a store records the forward moments for the smoother
+# and partial selects the partially nonlinear prediction
+def cubature_kalman_filter(x_est, p_est, z, store=None, partial=0):
+    if partial == 1 and store is None:
+        x_pred, p_pred = partial_cubature_prediction(x_est, p_est)
+    elif partial == 1:
+        x_pred, p_pred, cross = partial_cubature_prediction(x_est, p_est, cross=True)
+    elif store is None:
+        x_pred, p_pred, _, _ = cubature_prediction(x_est, p_est)
+    else:
+        x_pred, p_pred, _, _, cross = ckf.cubature_prediction_cross(x_est, p_est, f, q, rule)
     # return x_pred.astype(float), p_pred.astype(float)
     x_upd, p_upd = cubature_update(x_pred, p_pred, z)
+    if store is not None:
+        store.append(x_pred=x_pred, p_pred=p_pred, x_filt=x_upd, p_filt=p_upd, cross=cross)
     return x_upd.astype(float), p_upd.astype(float)
 
 
-# CTRV motion model f matrix
-def f(x):
-    x[0] = x[0] + (x[3]/x[4]) * (np.sin(x[4] * dt + x[2]) - np.sin(x[2]))
-    x[1] = x[1] + (x[3]/x[4]) * (- np.cos(x[4] * dt + x[2]) + np.cos(x[2]))
-    x[2] = x[2] + x[4] * dt
-    x[3] = x[3] + x[5] * dt
-    x[4] = x[4]
-    x[5] = x[5]
-    x.reshape((6, 1))
-    return x.astype(float)
+# square root cubature kalman filter, propagates the cholesky factor s_est of p_est
+def square_root_cubature_kalman_filter(x_est, s_est, z):
+    x_pred, s_pred = sqrt_cubature_prediction(x_est, s_est, f, sq)
+    x_upd, s_upd = sqrt_cubature_update(x_pred, s_pred, z, hx, sr)
+    return x_upd, s_upd
 
 
-# CTRV measurement model h matrix
-def h(x):
-    x = hx @ x
-    x.reshape((5, 1))
-    return x
+# CTRV motion model f matrix, written into out if given
+def f(x, out=None):
+    return ctra(x, dt, out)
 
 
-# generate sigma points
-def sigma(x, p):
-    n = np.shape(x)[0]
-    SP = np.zeros((n, 2*n))
-    W = np.zeros((1, 2*n))
-    for i in range(n):
-        SD = sqrtm(p)
-        SP[:, i] = (x + (math.sqrt(n) * SD[:, i]).reshape((n, 1))).flatten()
-        SP[:, i+n] = (x - (math.sqrt(n) * SD[:, i]).reshape((n, 1))).flatten()
-        W[:, i] = 1/(2*n)
-        W[:, i+n] = W[:, i]
-    return SP.astype(float), W.astype(float)
+# CTRV measurement model h matrix
+def h(x):
+    return hx @ x
 
 
 # cubature kalman filter nonlinear prediction step
 def cubature_prediction(x_pred, p_pred):
-    n = np.shape(x_pred)[0]
-    [SP, W] = sigma(x_pred, p_pred)
-    x_pred = np.zeros((n, 1))
-    p_pred = q
-    for i in range(2*n):
-        x_pred = x_pred + (f(SP[:, i]).reshape((n, 1)) * W[0, i])
-    for i in range(2*n):
-        p_step = (f(SP[:, i]).reshape((n, 1)) - x_pred)
-        p_pred = p_pred + (p_step @ np.transpose(p_step) * W[0, i])
-    return x_pred.astype(float), p_pred.astype(float)
-
-
-# cubature kalman filter nonlinear update step
+    return ckf.cubature_prediction(x_pred, p_pred, f, q, rule)
+
+
+# partially nonlinear prediction step, cubature over arc_states only, the cross
+# covariance for the smoother is only returned if cross is set
+def partial_cubature_prediction(x_pred, p_pred, cross=False):
+    return ckf.partial_cubature_prediction(partial_model, x_pred, p_pred, q, cross)
+
+
+# cubature kalman filter update step, the matrix hx takes the exact linear update so
+# no cubature points are carried into it
 def cubature_update(x_pred, p_pred, z):
-    n = np.shape(x_pred)[0]
-    m = np.shape(z)[0]
-    [SP, W] = sigma(x_pred, p_pred)
-    y_k = np.zeros((m, 1))
-    P_xy = np.zeros((n, m))
-    s = r
-    for i in range(2*n):
-        y_k = y_k + (h(SP[:, i]).reshape((m, 1)) * W[0, i])
-    for i in range(2*n):
-        p_step = (h(SP[:, i]).reshape((m, 1)) - y_k)
-        P_xy = P_xy + ((SP[:, i]).reshape((n, 1)) -
-                       x_pred) @ np.transpose(p_step) * W[0, i]
-        s = s + p_step @ np.transpose(p_step) * W[0, i]
-    x_pred = x_pred + P_xy @ np.linalg.pinv(s) @ (z - y_k)
-    p_pred = p_pred - P_xy @ np.linalg.pinv(s) @ np.transpose(P_xy)
-    return x_pred, p_pred
+    return ckf.cubature_update(x_pred, p_pred, z, hx, r, rule=rule)
 
 
 # cubature kalman filter linear update step
 def linear_update(x_pred, p_pred, z):
-    s = h @ p_pred @ np.transpose(h) + r
-    k = p_pred @ np.transpose(h) @ np.linalg.pinv(s)
-    v = z - h @ x_pred
-
-    x_upd = x_pred + k @ v
-    p_upd = p_pred - k @ s @ np.transpose(k)
-    return x_upd.astype(float), p_upd.astype(float)
+    return ckf.linear_update(x_pred, p_pred, z, hx, r)
 
 
 # generate ground truth measurement vector gz, noisy measurement vector z
 def gen_measurement(i):
-    x = float(cfs['XX'][i+1])
-    y = float(cfs['YY'][i+1])
-    vel = float(cfs['tv_velocity'][i+1])
-    v = float(cfs['GPSVel'][i+1])
-    wZsens = float(cfs['yawRate'][i+1])
-    a_x = float(cfs['ax'][i+1]) - 1.0
-    a_y = float(cfs['ay'][i+1])
-    acc = np.sqrt(a_x**2 + a_y**2)
-    gz = np.array([[x], [y], [v], [wZsens], [a_x]])
-    # z = gz + z_noise @ np.random.randn(4, 1)
-    return gz.astype(float), float(vel)
+    return z_all[i+1].reshape((-1, 1)), vel_all[i+1]
 
 
 # postprocessing
@@ -228,11 +247,13 @@ def plot_ellipse(x_est, p_est):
     plt.pause(0.00001)
 
 
-def plot_final(x_est_cat, z_cat):
+def plot_final(x_est_cat, z_cat, x_smooth_cat=None):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
     f.plot(x_est_cat[0:, 0], x_est_cat[0:, 1], 'b', label='Estimated Position')
+    if x_smooth_cat is not None:
+        f.plot(x_smooth_cat[0:, 0], x_smooth_cat[0:, 1], 'm', label='Smoothed Position')
     f.plot(z_cat[0:, 0], z_cat[0:, 1], '+g', label='Noisy Measurements')
     f.set_xlabel('x [m]')
     f.set_ylabel('y [m]')
@@ -255,12 +276,14 @@ def plot_final_2(x_est_cat, z_cat, i):
     plt.show()
 
 
-def plot_final_3(x_est_cat, z_cat, vel_cat, i):
+def plot_final_3(x_est_cat, z_cat, vel_cat, i, x_smooth_cat=None):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
     # f.plot(est_vel_cat[0:], 'b', label='Estimated Velocity')
     f.plot(x_est_cat[0:, 3], 'b', label='Estimated Velocity')
+    if x_smooth_cat is not None:
+        f.plot(x_smooth_cat[0:, 3], 'm', label='Smoothed Velocity')
     f.plot(vel_cat, '+g', label='Noisy Measurements')
     f.set_xlabel('Sample')
     f.set_ylabel('Velocity [m/s]')
@@ -312,16 +335,17 @@ def plot_final_6(x_est, z_cat, lat_vel_cat, i):
     plt.show()
 
 
-def postpross(i, x_est, p_est, x_est_cat, z, z_cat, vel_cat, lat_vel_cat, show_animation, show_ellipse, show_final_flag):
+def postpross(i, x_est, p_est, x_est_cat, z, z_cat, vel_cat, lat_vel_cat, show_animation, show_ellipse, show_final_flag,
+              x_smooth_cat=None):
     if show_animation == 1:
         plot_animation(i, x_est_cat, z)
         if show_ellipse == 1:
             plot_ellipse(x_est[0:2], p_est)
     if show_final_flag == 1:
-        plot_final_3(x_est_cat, z_cat, vel_cat, i)
+        plot_final_3(x_est_cat, z_cat, vel_cat, i, x_smooth_cat)
         # plot_final_5(x_est_cat, z_cat, i)
         # plot_final_6(x_est, z_cat, lat_vel_cat, i)
-        # plot_final(x_est_cat, z_cat)
+        # plot_final(x_est_cat, z_cat, x_smooth_cat)
 
 
 main()
@@ -5,12 +5,27 @@
 # measurement matrix:               2D noisy x-y position measured directly and yaw rate (3 x 1)
 
 import math
-import matplotlib.pyplot as plt
+import os
+import sys
 import numpy as np
 from scipy.linalg import sqrtm
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from others import cubature_transform as ckf
+from others.square_root_cubature import sqrt_cubature_prediction, sqrt_cubature_update
+from others.measurements import load_columns, measurement_matrix
+from others.motion_models import ct
+from others.trajectory import Trajectory
+
+# headless runs never import matplotlib or plot, pass --plot to show figures
+headless = '--plot' not in sys.argv[1:]
+if not headless:
+    import matplotlib.pyplot as plt
+
 # initalize global variables
-cfs = pd.read_csv('cfs_data_fsn17.csv')
+cfs = load_columns('cfs_data_fsn17.csv', ['XX', 'YY', 'tv_velocity', 'yawRate'])
+z_all = measurement_matrix(cfs, ['XX', 'YY', 'yawRate'])
+vel_all = cfs['tv_velocity']
 dt = 0.01                                               # seconds
 # N = int(len(cfs['XX']))-1                               # number of samples
 N = 5000
@@ -23,8 +38,8 @@ z_noise = np.array([[1.0, 0.0, 0.0],
 # prior mean
 x_0 = np.array([[0.0],                                  # x position    [m]
                 [0.0],                                  # y position    [m]
-                [0.0000001],                            # yaw           [rad]
                 [0.0000001],                            # velocity      [m/s]
+                [0.0000001],                            # yaw           [rad]
                 [0.0000001]])                           # yaw rate      [rad/s]
 
 
@@ -53,140 +68,103 @@ r = np.array([[0.015, 0.0, 0.0],
               [0.0, 0.010, 0.0],
               [0.0, 0.0, 0.01]])**2
 
+# square roots of q and r for the square root cubature kalman filter
+sq = np.linalg.cholesky(q)
+sr = np.linalg.cholesky(r)
+
+# cubature rule of the covariance filter, 'third', 'fifth' or 'gauss_hermite',
+# the square root filter always uses the third degree rule
+rule = 'third'
+
 
 # main program
 def main():
-    # show_final = int(input('Display final result? (No/Yes = 0/1) : '))
-    # show_animation = int(
-    # input('Show animation of filter working? (No/Yes = 0/1) : '))
-    # if show_animation == 1:
-    # show_ellipse = int(
-    # input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
-    # else:
-    # show_ellipse = 0
-    show_final = 1
-    show_animation = 0
-    show_ellipse = 0
+    if headless:
+        show_final = 0
+        show_animation = 0
+        show_ellipse = 0
+    else:
+        show_final = int(input('Display final result? (No/Yes = 0/1) : '))
+        show_animation = int(
+            input('Show animation of filter working? (No/Yes = 0/1) : '))
+        if show_animation == 1:
+            show_ellipse = int(
+                input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
+        else:
+            show_ellipse = 0
+    square_root = 0
     x_est = x_0
     p_est = p_0
+    s_est = np.linalg.cholesky(p_0)
     # x_true = x_0
     # p_true = p_0
     # x_true_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    x_est_cat = np.array(
-        [x_0[0, 0], x_0[1, 0], x_0[2, 0], x_0[3, 0], x_0[4, 0]])
-    z_cat = np.array([x_0[0, 0], x_0[1, 0], x_0[2, 0]])
-    vel_cat = np.array([x_0[2, 0]])
+    trajectory = Trajectory([('x', 5), ('z', 3), ('vel', 1)], N + 1)
+    trajectory.append(x=x_0, z=x_0[0:3], vel=x_0[2])
     for i in range(N):
         # x_true, p_true = extended_prediction(x_true, p_true)
         z, vel = gen_measurement(i)
-        if i == (N - 1) and show_final == 1:
-            show_final_flag = 1
+        if show_animation == 1:
+            postpross(i, x_est, p_est, trajectory['x'], z,
+                      trajectory['z'], trajectory['vel'], show_animation, show_ellipse, 0)
+        if square_root == 1:
+            x_est, s_est = square_root_cubature_kalman_filter(x_est, s_est, z)
+            if show_ellipse == 1:
+                p_est = s_est @ np.transpose(s_est)
         else:
-            show_final_flag = 0
-        postpross(i, x_est, p_est, x_est_cat, z,
-                  z_cat, vel_cat, show_animation, show_ellipse, show_final_flag)
-        x_est, p_est = cubature_kalman_filter(x_est, p_est, z)
+            x_est, p_est = cubature_kalman_filter(x_est, p_est, z)
         # x_true_cat = np.vstack((x_true_cat, np.transpose(x_true[0:2])))
-        z_cat = np.vstack((z_cat, np.transpose(z[0:3])))
-        vel_cat = np.vstack((vel_cat, vel))
-        x_est_cat = np.vstack((x_est_cat, np.transpose(x_est[0:5])))
+        trajectory.append(x=x_est, z=z, vel=vel)
+    if show_final == 1:
+        postpross(N - 1, x_est, p_est, trajectory['x'], z, trajectory['z'],
+                  trajectory['vel'], 0, 0, 1)
     print('CKF Over')
 
 
 # cubature kalman filter
 def cubature_kalman_filter(x_est, p_est, z):
-    x_pred, p_pred = cubature_prediction(x_est, p_est)
+    x_pred, p_pred, _, _ = cubature_prediction(x_est, p_est)
     # return x_pred.astype(float), p_pred.astype(float)
     x_upd, p_upd = cubature_update(x_pred, p_pred, z)
     return x_upd.astype(float), p_upd.astype(float)
 
 
+# square root cubature kalman filter, propagates the cholesky factor s_est of p_est
+def square_root_cubature_kalman_filter(x_est, s_est, z):
+    x_pred, s_pred = sqrt_cubature_prediction(x_est, s_est, f, sq)
+    x_upd, s_upd = sqrt_cubature_update(x_pred, s_pred, z, hx, sr)
+    return x_upd, s_upd
+
+
 # CT motion model f matrix
 def f(x):
-    x[0] = x[0] + dt * (x[3]) * np.cos(x[4])
-    x[1] = x[1] + dt * (x[3]) * np.sin(x[4])
-    x[2] = x[2]
-    x[3] = x[3] + x[4] * dt
-    x[4] = x[4]
-    x.reshape((5, 1))
-    return x.astype(float)
+    return ct(x, dt)
 
 
 # linear measurement model h matrix
 def h(x):
-    x = hx @ x
-    x.reshape((3, 1))
-    return x
-
-
-# generate sigma points
-def sigma(x, p):
-    n = np.shape(x)[0]
-    SP = np.zeros((n, 2*n))
-    W = np.zeros((1, 2*n))
-    for i in range(n):
-        SD = sqrtm(p)
-        SP[:, i] = (x + (math.sqrt(n) * SD[:, i]).reshape((n, 1))).flatten()
-        SP[:, i+n] = (x - (math.sqrt(n) * SD[:, i]).reshape((n, 1))).flatten()
-        W[:, i] = 1/(2*n)
-        W[:, i+n] = W[:, i]
-    return SP.astype(float), W.astype(float)
+    return hx @ x
 
 
 # cubature kalman filter nonlinear prediction step
 def cubature_prediction(x_pred, p_pred):
-    n = np.shape(x_pred)[0]
-    [SP, W] = sigma(x_pred, p_pred)
-    x_pred = np.zeros((n, 1))
-    p_pred = q
-    for i in range(2*n):
-        x_pred = x_pred + (f(SP[:, i]).reshape((n, 1)) * W[0, i])
-    for i in range(2*n):
-        p_step = (f(SP[:, i]).reshape((n, 1)) - x_pred)
-        p_pred = p_pred + (p_step @ np.transpose(p_step) * W[0, i])
-    return x_pred.astype(float), p_pred.astype(float)
-
-
-# cubature kalman filter nonlinear update step
+    return ckf.cubature_prediction(x_pred, p_pred, f, q, rule)
+
+
+# cubature kalman filter update step, the matrix hx takes the exact linear update so
+# no cubature points are carried into it
 def cubature_update(x_pred, p_pred, z):
-    n = np.shape(x_pred)[0]
-    m = np.shape(z)[0]
-    [SP, W] = sigma(x_pred, p_pred)
-    y_k = np.zeros((m, 1))
-    P_xy = np.zeros((n, m))
-    s = r
-    for i in range(2*n):
-        y_k = y_k + (h(SP[:, i]).reshape((m, 1)) * W[0, i])
-    for i in range(2*n):
-        p_step = (h(SP[:, i]).reshape((m, 1)) - y_k)
-        P_xy = P_xy + ((SP[:, i]).reshape((n, 1)) -
-                       x_pred) @ np.transpose(p_step) * W[0, i]
-        s = s + p_step @ np.transpose(p_step) * W[0, i]
-    x_pred = x_pred + P_xy @ np.linalg.pinv(s) @ (z - y_k)
-    p_pred = p_pred - P_xy @ np.linalg.pinv(s) @ np.transpose(P_xy)
-    return x_pred, p_pred
+    return ckf.cubature_update(x_pred, p_pred, z, hx, r, rule=rule)
 
 
 # cubature kalman filter linear update step
 def linear_update(x_pred, p_pred, z):
-    s = h @ p_pred @ np.transpose(h) + r
-    k = p_pred @ np.transpose(h) @ np.linalg.pinv(s)
-    v = z - h @ x_pred
-
-    x_upd = x_pred + k @ v
-    p_upd = p_pred - k @ s @ np.transpose(k)
-    return x_upd.astype(float), p_upd.astype(float)
+    return ckf.linear_update(x_pred, p_pred, z, hx, r)
 
 
 # generate ground truth measurement vector gz, noisy measurement vector z
 def gen_measurement(i):
-    x = float(cfs['XX'][i+1])
-    y = float(cfs['YY'][i+1])
-    vel = float(cfs['tv_velocity'][i+1])
-    wZsens = float(cfs['yawRate'][i+1])
-    gz = np.array([[x], [y], [wZsens]])
-    # z = gz + z_noise @ np.random.randn(4, 1)
-    return gz.astype(float), float(vel)
+    return z_all[i+1].reshape((-1, 1)), vel_all[i+1]
 
 
 # postprocessing
@@ -1,30 +1,54 @@
-# implementation of cubature kalman filter using CTRV model
+# implementation of cubature kalman filter using CTRA model with asynchronous multirate sensors
 
 # state matrix:                     2D x-y position, yaw, velocity, yaw rate and acceleration (6 x 1)
 # input matrix:                     --None--
-# measurement matrix:               2D noisy x-y position, yaw rate, acceleration, velocity from wheelspeed (5 x 1)
+# measurement matrix:               one stream per sensor, fused in time order as the samples arrive
+#                                   gps: 2D x-y position (10 Hz), imu: yaw rate and acceleration (200 Hz),
+#                                   speed: velocity (250 Hz), wspeed: velocity from wheelspeed (100 Hz)
 
 import math
-import matplotlib.pyplot as plt
+import os
+import sys
 import numpy as np
 from scipy.linalg import sqrtm
-import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from others import cubature_transform as ckf
+from others.square_root_cubature import sqrt_cubature_prediction, sqrt_cubature_update
+from others.motion_models import ctra
+from others.measurements import load_columns
+from others.fusion_scheduler import event_groups, stack_update
+from others.trajectory import Trajectory
+from others.state_history import StateHistory
+
+# headless runs never import matplotlib or plot, pass --plot to show figures
+headless = '--plot' not in sys.argv[1:]
+if not headless:
+    import matplotlib.pyplot as plt
 
 # initalize global variables
-amz = pd.read_csv('AMZ_data_non_resample_gps.csv')
+# every channel of the log is a separate sensor stream sampled at its own rate
+# from the start of the recording and padded with NaN to the longest stream
+amz = load_columns('AMZ_data_non_resample.csv',
+                   ['lat', 'long', 'a_x (m/s^2)', 'wZsens(rad/s)', 'lin_v_x(m/s)',
+                    'n_FL(RPM)', 'n_FR(RPM)', 'n_RL(RPM)', 'n_RR(RPM)'])
 dt_gps = 1/10                                                       # seconds
 dt_imu = 1/200                                                       # seconds
 dt_speed = 1/250                                                       # seconds
 dt_wspeed = 1/100                                                       # seconds
-# N = int(len(cfs['XX']))-1                                    # number of samples
-N = 500
+# t_end = 155.5                                                 # whole log
+t_end = 10.0                                                    # seconds of the log to fuse
+earth_radius = 6378137.0                                        # m
+rpm_to_speed = 1.608e-3                                         # m/s per rpm, fit of the wheel speeds to lin_v_x
+latency = {'gps': 0.0}                                          # seconds a sensor arrives after its time stamp
+max_rewind = 96                                                 # most steps replayed for a late measurement
 
 # prior mean
 x_0 = np.array([[0.0],                                  # x position    [m]
                 [0.0],                                  # y position    [m]
                 [1e-6],                                 # yaw           [rad]
                 [1e-6],                                 # velocity      [m/s]
-                [1e-6],                                 # yaw rate      [rad/s]
+                [0.0],                                  # yaw rate      [rad/s]
                 [1e-6]])                                # acceleration  [m/s^2]
 
 
@@ -37,7 +61,7 @@ p_0 = np.array([[1.0, 0.0, 0.0, 0.0, 0.0, 0.0],
                 [0.0, 0.0, 0.0, 0.0, 0.0, 1.0]])
 
 
-# q matrix - process noise
+# q matrix - process noise of an imu period, scaled with the prediction step
 q = np.array([[1e-6, 0.0, 0.0, 0.0, 0.0, 0.0],
               [0.0, 1e-6, 0.0, 0.0, 0.0, 0.0],
               [0.0, 0.0, 1e-8, 0.0, 0.0, 0.0],
@@ -45,162 +69,147 @@ q = np.array([[1e-6, 0.0, 0.0, 0.0, 0.0, 0.0],
               [0.0, 0.0, 0.0, 0.0, 1e-4, 0.0],
               [0.0, 0.0, 0.0, 0.0, 0.0, 1e-4]])
 
-# h matrix - measurement matrix
+# h matrix - rows of the measured states
 hx = np.array([[1.0, 0.0, 0.0, 0.0, 0.0, 0.0],      # x position    [m]
                [0.0, 1.0, 0.0, 0.0, 0.0, 0.0],      # y position    [m]
                [0.0, 0.0, 0.0, 1.0, 0.0, 0.0],      # velocity      [m/s]
                [0.0, 0.0, 0.0, 0.0, 1.0, 0.0],      # yaw rate      [rad/s]
                [0.0, 0.0, 0.0, 0.0, 0.0, 1.0]])     # acceleration  [m/s^2]
 
-# r matrix - measurement noise covariance
+# r matrix - measurement noise covariance of the hx rows
 r = np.array([[0.015, 0.0, 0.0, 0.0, 0.0],
               [0.0, 0.010, 0.0, 0.0, 0.0],
               [0.0, 0.0, 0.01, 0.0, 0.0],
               [0.0, 0.0, 0.0, 0.01, 0.0],
               [0.0, 0.0, 0.0, 0.0, 0.01]])**2
 
+# square root of q for the square root cubature kalman filter
+sq = np.linalg.cholesky(q)
+
+# cubature rule of the covariance filter, 'third', 'fifth' or 'gauss_hermite',
+# the square root filter always uses the third degree rule
+rule = 'third'
+
+# sensors - measured rows of hx and noise covariance of every stream
+sensors = {'gps': (hx[[0, 1]], r[0:2, 0:2]),
+           'imu': (hx[[3, 4]], r[3:5, 3:5]),
+           'speed': (hx[[2]], r[2:3, 2:3]),
+           'wspeed': (hx[[2]], np.array([[0.3]])**2)}
+
+
+# times (K) and values (K x m) of a stream sampled every dt seconds, NaN padding and
+# samples after t_end are dropped
+def stream(dt, values):
+    values = np.reshape(values, (np.shape(values)[0], -1))
+    times = np.arange(np.shape(values)[0]) * dt
+    keep = np.all(np.isfinite(values), axis=1) & (times <= t_end)
+    return times[keep], values[keep]
+
+
+# gps fixes as x-y position in metres from the first fix, fixes at 0, 0 are dropouts
+def gps_position(lat, lon):
+    valid = np.isfinite(lat) & (lat != 0.0)
+    lat_0 = lat[valid][0]
+    lon_0 = lon[valid][0]
+    x = earth_radius * np.radians(lon - lon_0) * np.cos(np.radians(lat_0))
+    y = earth_radius * np.radians(lat - lat_0)
+    return np.where(valid[:, None], np.column_stack((x, y)), np.nan)
+
+
+streams = {'gps': stream(dt_gps, gps_position(amz['lat'], amz['long'])),
+           'imu': stream(dt_imu, np.column_stack((amz['wZsens(rad/s)'], amz['a_x (m/s^2)']))),
+           'speed': stream(dt_speed, amz['lin_v_x(m/s)']),
+           'wspeed': stream(dt_wspeed, rpm_to_speed * np.mean([amz['n_FL(RPM)'], amz['n_FR(RPM)'],
+                                                               amz['n_RL(RPM)'], amz['n_RR(RPM)']], axis=0))}
+
 
 # main program
 def main():
-    # show_final = int(input('Display final result? (No/Yes = 0/1) : '))
-    # show_animation = int(
-    # input('Show animation of filter working? (No/Yes = 0/1) : '))
-    # if show_animation == 1:
-    # show_ellipse = int(
-    # input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
-    # else:
-    # show_ellipse = 0
-    show_final = 1
-    show_animation = 0
-    show_ellipse = 0
-    x_est = x_0
-    p_est = p_0
-    # x_true = x_0
-    # p_true = p_0
-    # x_true_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    x_est_cat = np.array(
-        [x_0[0, 0], x_0[1, 0], x_0[2, 0], x_0[3, 0], x_0[4, 0], x_0[5, 0]])
-    z_cat = np.array([x_0[0, 0], x_0[1, 0], x_0[3, 0], x_0[4, 0], x_0[5, 0]])
-    vel_cat = np.array([x_0[3, 0]])
-    lat_vel_cat = np.array([x_0[3, 0]])
-    for i in range(N):
-        # x_true, p_true = extended_prediction(x_true, p_true)
-        z, vel = gen_measurement(i)
-        if i == (N - 1) and show_final == 1:
-            show_final_flag = 1
+    if headless:
+        show_final = 0
+        show_animation = 0
+        show_ellipse = 0
+    else:
+        show_final = int(input('Display final result? (No/Yes = 0/1) : '))
+        show_animation = int(
+            input('Show animation of filter working? (No/Yes = 0/1) : '))
+        if show_animation == 1:
+            show_ellipse = int(
+                input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
         else:
-            show_final_flag = 0
-        # x_true_cat = np.vstack((x_true_cat, np.transpose(x_true[0:2])))
-        z_cat = np.vstack((z_cat, np.transpose(z[0:5])))
-        # vel_cat = np.vstack((vel_cat, vel * np.sin(x_est[2])))
-        vel_cat = np.vstack((vel_cat, vel))
-        lat_vel_cat = np.vstack((lat_vel_cat, x_est[3] * np.cos(x_est[2])))
-        x_est_cat = np.vstack((x_est_cat, np.transpose(x_est[0:6])))
-        postpross(i, x_est, p_est, x_est_cat, z,
-                  z_cat, vel_cat, lat_vel_cat, show_animation, show_ellipse, show_final_flag)
-        x_est, p_est = cubature_kalman_filter(x_est, p_est, z)
+            show_ellipse = 0
+    square_root = 0
+    # the square root filter carries the cholesky factor of p_est instead
+    step = square_root_cubature_kalman_filter if square_root == 1 else cubature_kalman_filter
+    x_est = x_0
+    p_est = np.linalg.cholesky(p_0) if square_root == 1 else p_0
+    t = 0.0
+    history = StateHistory(6, sum(np.shape(h_sensor)[0] for h_sensor, _ in sensors.values()), capacity=128)
+    history.push(t, x_est, p_est, np.zeros((0, 1)), np.zeros((0, 6)), np.zeros((0, 0)))
+    dropped = 0
+    trajectory = Trajectory([('t', 1), ('x', 6), ('lat_vel', 1)])
+    trajectory.append(t=t, x=x_0, lat_vel=x_0[3])
+    # delayed sensors are scheduled by arrival time and applied at their time stamp
+    arrivals = {name: (times + latency.get(name, 0.0), values) for name, (times, values) in streams.items()}
+    for i, (t_event, events) in enumerate(event_groups(arrivals)):
+        on_time = [(name, value) for name, value in events if latency.get(name, 0.0) == 0.0]
+        if on_time:
+            # one prediction up to the event, then one update stacked over its sensors
+            z, h_event, r_event = stack_update(on_time, sensors)
+            x_est, p_est = step(x_est, p_est, z, t_event - t, h_event, r_event)
+            t = t_event
+            history.push(t, x_est, p_est, z, h_event, r_event)
+        for name, value in events:
+            if latency.get(name, 0.0) > 0.0:
+                z, h_event, r_event = stack_update([(name, value)], sensors)
+                if history.apply_late(step, t_event - latency[name], z, h_event, r_event, max_rewind):
+                    t, x_est, p_est = history.latest()
+                else:
+                    dropped += 1
+        trajectory.append(t=t, x=x_est, lat_vel=x_est[3] * np.cos(x_est[2]))
+        # the position is only plotted with a gps fix applied on time in this group
+        gps = [value for name, value in on_time if name == 'gps']
+        if show_animation == 1 and gps:
+            p_plot = p_est @ np.transpose(p_est) if square_root == 1 else p_est
+            postpross(i, x_est, p_plot, trajectory['t'], trajectory['x'], np.reshape(gps[0], (-1, 1)),
+                      trajectory['lat_vel'], show_animation, show_ellipse, 0)
+    if dropped > 0:
+        print(dropped, 'late measurements fell outside the state history or max_rewind and were dropped')
+    if show_final == 1:
+        postpross(i, x_est, p_est, trajectory['t'], trajectory['x'], z, trajectory['lat_vel'], 0, 0, 1)
     print('CKF Over')
 
 
-# cubature kalman filter
-def cubature_kalman_filter(x_est, p_est, z):
-    x_pred, p_pred = cubature_prediction(x_est, p_est)
-    # return x_pred.astype(float), p_pred.astype(float)
-    x_upd, p_upd = cubature_update(x_pred, p_pred, z)
+# cubature kalman filter, predicts over dt and updates with the stacked events
+def cubature_kalman_filter(x_est, p_est, z, dt, h_event, r_event):
+    if dt > 0.0:
+        x_est, p_est = cubature_prediction(x_est, p_est, dt)
+    x_upd, p_upd = ckf.cubature_update(x_est, p_est, z, h_event, r_event, rule=rule)
     return x_upd.astype(float), p_upd.astype(float)
 
 
-# CTRV motion model f matrix
-def f(x):
-    x[0] = x[0] + (x[3]/x[4]) * (np.sin(x[4] * dt + x[2]) - np.sin(x[2]))
-    x[1] = x[1] + (x[3]/x[4]) * (- np.cos(x[4] * dt + x[2]) + np.cos(x[2]))
-    x[2] = x[2] + x[4] * dt
-    x[3] = x[3] + x[5] * dt
-    x[4] = x[4]
-    x[5] = x[5]
-    x.reshape((6, 1))
-    return x.astype(float)
-
+# square root cubature kalman filter, propagates the cholesky factor s_est of p_est
+def square_root_cubature_kalman_filter(x_est, s_est, z, dt, h_event, r_event):
+    if dt > 0.0:
+        x_est, s_est = sqrt_cubature_prediction(x_est, s_est, lambda x: f(x, dt), sq * np.sqrt(dt / dt_imu))
+    x_upd, s_upd = sqrt_cubature_update(x_est, s_est, z, h_event, np.linalg.cholesky(r_event))
+    return x_upd, s_upd
 
-# CTRV measurement model h matrix
-def h(x):
-    x = hx @ x
-    x.reshape((5, 1))
-    return x
-
-
-# generate sigma points
-def sigma(x, p):
-    n = np.shape(x)[0]
-    SP = np.zeros((n, 2*n))
-    W = np.zeros((1, 2*n))
-    for i in range(n):
-        SD = sqrtm(p)
-        SP[:, i] = (x + (math.sqrt(n) * SD[:, i]).reshape((n, 1))).flatten()
-        SP[:, i+n] = (x - (math.sqrt(n) * SD[:, i]).reshape((n, 1))).flatten()
-        W[:, i] = 1/(2*n)
-        W[:, i+n] = W[:, i]
-    return SP.astype(float), W.astype(float)
-
-
-# cubature kalman filter nonlinear prediction step
-def cubature_prediction(x_pred, p_pred):
-    n = np.shape(x_pred)[0]
-    [SP, W] = sigma(x_pred, p_pred)
-    x_pred = np.zeros((n, 1))
-    p_pred = q
-    for i in range(2*n):
-        x_pred = x_pred + (f(SP[:, i]).reshape((n, 1)) * W[0, i])
-    for i in range(2*n):
-        p_step = (f(SP[:, i]).reshape((n, 1)) - x_pred)
-        p_pred = p_pred + (p_step @ np.transpose(p_step) * W[0, i])
-    return x_pred.astype(float), p_pred.astype(float)
-
-
-# cubature kalman filter nonlinear update step
-def cubature_update(x_pred, p_pred, z):
-    n = np.shape(x_pred)[0]
-    m = np.shape(z)[0]
-    [SP, W] = sigma(x_pred, p_pred)
-    y_k = np.zeros((m, 1))
-    P_xy = np.zeros((n, m))
-    s = r
-    for i in range(2*n):
-        y_k = y_k + (h(SP[:, i]).reshape((m, 1)) * W[0, i])
-    for i in range(2*n):
-        p_step = (h(SP[:, i]).reshape((m, 1)) - y_k)
-        P_xy = P_xy + ((SP[:, i]).reshape((n, 1)) -
-                       x_pred) @ np.transpose(p_step) * W[0, i]
-        s = s + p_step @ np.transpose(p_step) * W[0, i]
-    x_pred = x_pred + P_xy @ np.linalg.pinv(s) @ (z - y_k)
-    p_pred = p_pred - P_xy @ np.linalg.pinv(s) @ np.transpose(P_xy)
-    return x_pred, p_pred
 
+# CTRA motion model f matrix over a step of dt seconds
+def f(x, dt):
+    return ctra(x, dt)
 
-# cubature kalman filter linear update step
-def linear_update(x_pred, p_pred, z):
-    s = h @ p_pred @ np.transpose(h) + r
-    k = p_pred @ np.transpose(h) @ np.linalg.pinv(s)
-    v = z - h @ x_pred
 
-    x_upd = x_pred + k @ v
-    p_upd = p_pred - k @ s @ np.transpose(k)
-    return x_upd.astype(float), p_upd.astype(float)
+# CTRA measurement model h matrix
+def h(x):
+    return hx @ x
 
 
-# generate ground truth measurement vector gz, noisy measurement vector z
-def gen_measurement(i):
-    x = float(cfs['XX'][i+1])
-    y = float(cfs['YY'][i+1])
-    vel = float(cfs['tv_velocity'][i+1])
-    v = float(cfs['GPSVel'][i+1])
-    wZsens = float(cfs['yawRate'][i+1])
-    a_x = float(cfs['ax'][i+1]) - 1.0
-    a_y = float(cfs['ay'][i+1])
-    acc = np.sqrt(a_x**2 + a_y**2)
-    gz = np.array([[x], [y], [v], [wZsens], [a_x]])
-    # z = gz + z_noise @ np.random.randn(4, 1)
-    return gz.astype(float), float(vel)
+# cubature kalman filter nonlinear prediction step over dt seconds
+def cubature_prediction(x_pred, p_pred, dt):
+    x_pred, p_pred, _, _ = ckf.cubature_prediction(x_pred, p_pred, lambda x: f(x, dt), q * (dt / dt_imu), rule)
+    return x_pred, p_pred
 
 
 # postprocessing
@@ -245,12 +254,12 @@ def plot_final(x_est_cat, z_cat):
     plt.show()
 
 
-def plot_final_2(x_est_cat, z_cat, i):
+def plot_final_2(t_cat, x_est_cat):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
-    f.plot(x_est_cat[0:, 2] * 180/np.pi, 'b', label='Estimated Yaw')
-    f.set_xlabel('Sample')
+    f.plot(t_cat, x_est_cat[0:, 2] * 180/np.pi, 'b', label='Estimated Yaw')
+    f.set_xlabel('Time [s]')
     f.set_ylabel('Yaw [degrees]')
     f.set_title('Cubature Kalman Filter - CTRA Model')
     f.legend(loc='upper right', shadow=True, fontsize='large')
@@ -258,14 +267,14 @@ def plot_final_2(x_est_cat, z_cat, i):
     plt.show()
 
 
-def plot_final_3(x_est_cat, z_cat, vel_cat, i):
+def plot_final_3(t_cat, x_est_cat, vel_stream):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
     # f.plot(est_vel_cat[0:], 'b', label='Estimated Velocity')
-    f.plot(x_est_cat[0:, 3], 'b', label='Estimated Longitudinal Velocity')
-    f.plot(vel_cat, '+g', label='Noisy Measurements')
-    f.set_xlabel('Sample')
+    f.plot(t_cat, x_est_cat[0:, 3], 'b', label='Estimated Longitudinal Velocity')
+    f.plot(vel_stream[0], vel_stream[1][0:, 0], '+g', label='Noisy Measurements')
+    f.set_xlabel('Time [s]')
     f.set_ylabel('Velocity [m/s]')
     f.set_title('Cubature Kalman Filter - CTRA Model')
     f.legend(loc='upper right', shadow=True, fontsize='large')
@@ -273,13 +282,13 @@ def plot_final_3(x_est_cat, z_cat, vel_cat, i):
     plt.show()
 
 
-def plot_final_4(x_est_cat, z_cat, i):
+def plot_final_4(t_cat, x_est_cat, imu_stream):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
-    f.plot(x_est_cat[0:, 4], 'b', label='Estimated Yaw Rate')
-    f.plot(z_cat[0:, 2], '+g', label='Noisy Measurements')
-    f.set_xlabel('Sample')
+    f.plot(t_cat, x_est_cat[0:, 4], 'b', label='Estimated Yaw Rate')
+    f.plot(imu_stream[0], imu_stream[1][0:, 0], '+g', label='Noisy Measurements')
+    f.set_xlabel('Time [s]')
     f.set_ylabel('Yaw Rate [rad/s]')
     f.set_title('Cubature Kalman Filter - CTRA Model')
     f.legend(loc='upper right', shadow=True, fontsize='large')
@@ -287,13 +296,13 @@ def plot_final_4(x_est_cat, z_cat, i):
     plt.show()
 
 
-def plot_final_5(x_est_cat, z_cat, i):
+def plot_final_5(t_cat, x_est_cat, imu_stream):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
-    f.plot(x_est_cat[0:, 5], 'b', label='Estimated Acceleration')
-    f.plot(z_cat[0:, 3], '+g', label='Noisy Measurements')
-    f.set_xlabel('Sample')
+    f.plot(t_cat, x_est_cat[0:, 5], 'b', label='Estimated Acceleration')
+    f.plot(imu_stream[0], imu_stream[1][0:, 1], '+g', label='Noisy Measurements')
+    f.set_xlabel('Time [s]')
     f.set_ylabel('Acceleration [m/s^2]')
     f.set_title('Cubature Kalman Filter - CTRA Model')
     f.legend(loc='upper right', shadow=True, fontsize='large')
@@ -301,13 +310,13 @@ def plot_final_5(x_est_cat, z_cat, i):
     plt.show()
 
 
-def plot_final_6(x_est, z_cat, lat_vel_cat, i):
+def plot_final_6(t_cat, lat_vel_cat):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
-    f.plot(lat_vel_cat[0:], 'b', label='Estimated Lateral Velocity')
+    f.plot(t_cat, lat_vel_cat[0:], 'b', label='Estimated Lateral Velocity')
     # f.plot(z_cat[0:, 3], '+g', label='Noisy Measurements')
-    f.set_xlabel('Sample')
+    f.set_xlabel('Time [s]')
     f.set_ylabel('Velocity [m/s]')
     f.set_title('Cubature Kalman Filter - CTRA Model')
     f.legend(loc='upper right', shadow=True, fontsize='large')
@@ -315,16 +324,16 @@ def plot_final_6(x_est, z_cat, lat_vel_cat, i):
     plt.show()
 
 
-def postpross(i, x_est, p_est, x_est_cat, z, z_cat, vel_cat, lat_vel_cat, show_animation, show_ellipse, show_final_flag):
+def postpross(i, x_est, p_est, t_cat, x_est_cat, z, lat_vel_cat, show_animation, show_ellipse, show_final_flag):
     if show_animation == 1:
         plot_animation(i, x_est_cat, z)
         if show_ellipse == 1:
             plot_ellipse(x_est[0:2], p_est)
     if show_final_flag == 1:
-        plot_final_3(x_est_cat, z_cat, vel_cat, i)
-        # plot_final_5(x_est_cat, z_cat, i)
-        # plot_final_6(x_est, z_cat, lat_vel_cat, i)
-        # plot_final(x_est_cat, z_cat)
+        plot_final_3(t_cat, x_est_cat, streams['speed'])
+        # plot_final_5(t_cat, x_est_cat, streams['imu'])
+        # plot_final_6(t_cat, lat_vel_cat)
+        # plot_final(x_est_cat, streams['gps'][1])
 
 
 main()
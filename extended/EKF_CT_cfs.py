@@ -5,13 +5,25 @@
 # measurement matrix:               2D noisy x-y position measured directly and yaw rate (3 x 1)
 
 import math
-import matplotlib.pyplot as plt
+import os
+import sys
 import numpy as np
 from scipy.linalg import sqrtm
-import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from others.kalman_update import linear_kalman_update
+from others.measurements import load_columns, measurement_matrix
+from others.trajectory import Trajectory
+from others.generated import ct
+
+# headless runs never import matplotlib or plot, pass --plot to show figures
+headless = '--plot' not in sys.argv[1:]
+if not headless:
+    import matplotlib.pyplot as plt
 
 # initalize global variables
-cfs = pd.read_csv('cfs_data_fsn17.csv')
+cfs = load_columns('cfs_data_fsn17.csv', ['XX', 'YY', 'yawRate'])
+z_all = measurement_matrix(cfs, ['XX', 'YY', 'yawRate'])
 dt = 0.1                                               # seconds
 # N = int(len(cfs['XX']))-1                               # number of samples
 N = 300
@@ -24,8 +36,8 @@ z_noise = np.array([[1.0, 0.0, 0.0],
 # prior mean
 x_0 = np.array([[0.0],                                  # x position    [m]
                 [0.0],                                  # y position    [m]
-                [0.0000001],                            # yaw           [rad]
                 [0.0000001],                            # velocity      [m/s]
+                [0.0000001],                            # yaw           [rad]
                 [0.0000001]])                           # yaw rate      [rad/s]
 
 
@@ -56,43 +68,42 @@ r = np.array([[0.015, 0.0, 0.0],
 
 # main program
 def main():
-    show_final = int(input('Display final result? (No/Yes = 0/1) : '))
-    show_animation = int(
-        input('Show animation of filter working? (No/Yes = 0/1) : '))
-    if show_animation == 1:
-        show_ellipse = int(
-            input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
-    else:
+    if headless:
+        show_final = 0
+        show_animation = 0
         show_ellipse = 0
+    else:
+        show_final = int(input('Display final result? (No/Yes = 0/1) : '))
+        show_animation = int(
+            input('Show animation of filter working? (No/Yes = 0/1) : '))
+        if show_animation == 1:
+            show_ellipse = int(
+                input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
+        else:
+            show_ellipse = 0
     x_est = x_0
     p_est = p_0
     x_true = x_0
     p_true = p_0
-    x_true_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    x_est_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    z_cat = np.array([x_0[0, 0], x_0[1, 0]])
+    trajectory = Trajectory([('x_true', 2), ('x', 2), ('z', 2)], N + 1)
+    trajectory.append(x_true=x_0[0:2], x=x_0[0:2], z=x_0[0:2])
     for i in range(N):
         x_true, p_true = extended_prediction(x_true, p_true)
         gz = gen_measurement(x_true, i)
-        if i == (N - 1) and show_final == 1:
-            show_final_flag = 1
-        else:
-            show_final_flag = 0
-        postpross(i, x_true, x_true_cat, x_est, p_est, x_est_cat, gz,
-                  z_cat, show_animation, show_ellipse, show_final_flag)
+        if show_animation == 1:
+            postpross(i, x_true, trajectory['x_true'], x_est, p_est, trajectory['x'], gz,
+                      trajectory['z'], show_animation, show_ellipse, 0)
         x_est, p_est = extended_kalman_filter(x_est, p_est, gz)
-        x_true_cat = np.vstack((x_true_cat, np.transpose(x_true[0:2])))
-        z_cat = np.vstack((z_cat, np.transpose(gz[0:2])))
-        x_est_cat = np.vstack((x_est_cat, np.transpose(x_est[0:2])))
+        trajectory.append(x_true=x_true[0:2], x=x_est[0:2], z=gz[0:2])
+    if show_final == 1:
+        postpross(N - 1, x_true, trajectory['x_true'], x_est, p_est,
+                  trajectory['x'], gz, trajectory['z'], 0, 0, 1)
     print('EKF Over')
 
 
 # generate ground truth measurement vector gz, noisy measurement vector z
 def gen_measurement(x_true, i):
-    x = float(cfs['XX'][i+1])
-    y = float(cfs['YY'][i+1])
-    wZsens = float(cfs['yawRate'][i+1])
-    gz = np.array([[x], [y], [wZsens]])
+    gz = z_all[i+1].reshape((-1, 1))
     z = gz + z_noise @ np.random.randn(3, 1)
     return gz
 
@@ -105,35 +116,17 @@ def extended_kalman_filter(x_est, p_est, z):
     return x_upd, p_upd
 
 
-# extended kalman filter nonlinear prediction step
+# extended kalman filter nonlinear prediction step, the CT model and its jacobian
+# are generated from others/jacobian.py
 def extended_prediction(x, p):
-
-    # f(x)
-    x[0] = x[0] + dt * (x[3]) * np.cos(x[4])
-    x[1] = x[1] + dt * (x[3]) * np.sin(x[4])
-    x[2] = x[2]
-    x[3] = x[3] + x[4] * dt
-    x[4] = x[4]
-    x_pred = x
-    
-    jF = np.array([[1, 0, dt * np.cos(x[4]), -dt * x[3] * np.sin(x[4]), 0],
-                   [0, 1, dt * np.sin(x[4]), dt * x[3] * np.cos(x[4]),  0],
-                   [0, 0, 1,             0,                             0],
-                   [0, 0, 0,             1,                             dt],
-                   [0, 0, 0,             0,                             1]])
-    
-    p_pred = jF @ p @ np.transpose(jF) + q
-    return x_pred.astype(float), p_pred.astype(float)
+    x_pred, jF = ct.f_jacobian(x, dt)
+    p_pred = jF[0] @ p @ np.transpose(jF[0]) + q
+    return x_pred, p_pred
 
 
 # extended kalman filter linear update step
 def linear_update(x_pred, p_pred, z):
-    s = hx @ p_pred @ np.transpose(hx) + r
-    k = p_pred @ np.transpose(hx) @ np.linalg.pinv(s)
-    v = z - hx @ x_pred
-
-    x_upd = x_pred + k @ v
-    p_upd = p_pred - k @ s @ np.transpose(k)
+    x_upd, p_upd = linear_kalman_update(x_pred, p_pred, z, hx, r)
     return x_upd.astype(float), p_upd.astype(float)
 
 
@@ -5,17 +5,33 @@
 # measurement matrix:       2D x-y position and acceleration in x and y axis (4 x 1)
 
 import math
-import matplotlib.pyplot as plt
+import os
+import sys
 import numpy as np
-from scipy.sparse.linalg import expm
 from scipy.linalg import sqrtm
-import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from others.kalman_update import linear_kalman_update
+from others.measurements import load_columns, measurement_matrix
+from others.trajectory import Trajectory
+from others.steady_state import steady_state_gain, filtered_gain, has_converged
+from others.parallel_kalman import parallel_kalman_filter
+from others.rts_smoother import rts_smoother, predict_stack
+from others.discretization import Discretization
+from others.filter_step import Workspace, kalman_step
+
+# headless runs never import matplotlib or plot, pass --plot to show figures
+headless = '--plot' not in sys.argv[1:]
+if not headless:
+    import matplotlib.pyplot as plt
 
 # initalize global variables
-cfs = pd.read_csv('cfs_data_fsn17.csv')
+cfs = load_columns('cfs_data_fsn17.csv', ['XX', 'YY', 'ax', 'ay'])
+z_all = measurement_matrix(cfs, ['XX', 'YY', 'ax', 'ay'])
 dt = 0.01  # seconds
-N = int(len(cfs.XX))-1  # number of samples
+N = int(len(cfs['XX']))-1  # number of samples
 # N = 300
+dt_all = np.full(len(cfs['XX']), dt)  # sample intervals, the logs carry no timestamps
 qc = 0.0000001  # process noise magnitude
 
 z_noise = 1  # measurement noise magnitude
@@ -48,13 +64,21 @@ a = np.array([[0.0, 0.0, 1.0, 0.0, 0.0, 0.0],
               [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]])
 
 
-a = expm(dt * a)
-gamma = np.array([[0.0], [0.0], [0.0], [0.0], [1.0], [1.0]])
+# noise input of the x and y acceleration, independent per axis
+gamma = np.array([[0.0, 0.0],
+                  [0.0, 0.0],
+                  [0.0, 0.0],
+                  [0.0, 0.0],
+                  [1.0, 0.0],
+                  [0.0, 1.0]])
 
 
 # q matrix - continuous time process noise covariance
 q = qc * gamma @ np.transpose(gamma)
-q_euler = dt * q
+
+# exact transition and process noise of a step, cached per quantized step length
+discretize = Discretization(a, q)
+a, q_d = discretize(dt)
 
 
 # h matrix - measurement model
@@ -73,42 +97,88 @@ r = np.array([[0.010, 0.0, 0.0, 0.0],
 
 # main program
 def main():
-    show_final = int(input('Display final result? (No/Yes = 0/1) : '))
-    show_animation = int(
-        input('Show animation of filter working? (No/Yes = 0/1) : '))
-    if show_animation == 1:
-        show_ellipse = int(
-            input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
-    else:
+    if headless:
+        show_final = 0
+        show_animation = 0
         show_ellipse = 0
+    else:
+        show_final = int(input('Display final result? (No/Yes = 0/1) : '))
+        show_animation = int(
+            input('Show animation of filter working? (No/Yes = 0/1) : '))
+        if show_animation == 1:
+            show_ellipse = int(
+                input('Display covariance ellipses in animation? (No/Yes = 0/1) : '))
+        else:
+            show_ellipse = 0
+    offline = 0
+    smooth = 0
+    # steady state gain once the filter gain has converged, needs a q that drives every
+    # mode of a, which the per axis noise inputs of gamma do
+    steady_state = 0
+    switch_over = 1
+    preallocate = 0
     x_est = x_0
     p_est = p_0
+    workspace = None
+    if preallocate == 1:
+        # the step writes into preallocated buffers and overwrites x_est and p_est
+        workspace = Workspace(np.shape(h)[1], np.shape(h)[0], h=h)
+        x_est, p_est = x_0.copy(), p_0.copy()
+    converged = 0
+    if steady_state == 1:
+        a_ss, k_ss, p_ss = steady_state_gain(a, q_d, h, r)
+        p_pred_ss = a @ p_ss @ np.transpose(a) + q_d
     # x_true_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    x_est_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    z_cat = np.array([x_0[0, 0], x_0[1, 0]])
-    for i in range(N):
-        z = gen_measurement(i)
-        if i == (N - 1) and show_final == 1:
-            show_final_flag = 1
-        else:
-            show_final_flag = 0
-        postpross(x_est, p_est,
-                  x_est_cat, z_cat, z, show_animation, show_ellipse, show_final_flag)
-        x_est, p_est = kalman_filter(x_est, p_est, z)
-        # x_true_cat = np.vstack((x_true_cat, np.transpose(x_true[0:2])))
-        z_cat = np.vstack((z_cat, np.transpose(z[0:2])))
-        x_est_cat = np.vstack((x_est_cat, np.transpose(x_est[0:2])))
+    trajectory = Trajectory([('x', 2), ('z', 2)], N + 1)
+    trajectory.append(x=x_0[0:2], z=x_0[0:2])
+    # predicted and filtered moments of every step for the smoother, row 0 is the prior
+    history = Trajectory([('x_pred', 6), ('p_pred', (6, 6)), ('x_filt', 6), ('p_filt', (6, 6))],
+                         N + 1 if smooth == 1 else 1)
+    history.append(x_pred=x_0, p_pred=p_0, x_filt=x_0, p_filt=p_0)
+    if offline == 1:
+        x_filt, p_filt = parallel_kalman_filter(a, q_d, h, r, x_0, p_0, z_all[1:N+1])
+        trajectory.extend(x=x_filt[:, 0:2], z=z_all[1:N+1, 0:2])
+        if smooth == 1:
+            x_pred, p_pred = predict_stack(a, q_d, np.vstack((np.transpose(x_0), x_filt[:-1])),
+                                           np.concatenate((p_0[np.newaxis], p_filt[:-1])))
+            history.extend(x_pred=x_pred, p_pred=p_pred, x_filt=x_filt, p_filt=p_filt)
+        x_est = x_filt[-1].reshape((-1, 1))
+        p_est = p_filt[-1]
+        z = gen_measurement(N - 1)
+    else:
+        for i in range(N):
+            z = gen_measurement(i)
+            if show_animation == 1:
+                postpross(x_est, p_est,
+                          trajectory['x'], trajectory['z'], z, show_animation, show_ellipse, 0)
+            if steady_state == 1 and converged == 0:
+                converged = int(switch_over == 0 or has_converged(filtered_gain(p_est, h, r), k_ss))
+            if converged == 1:
+                x_pred, p_pred = a @ x_est, p_pred_ss
+                x_est = a_ss @ x_est + k_ss @ z
+                p_est = p_ss
+            elif workspace is not None:
+                a_k, q_k = discretize(dt_all[i+1])
+                kalman_step(workspace, x_est, p_est, z, a_k, q_k, h, r)
+                x_pred, p_pred = workspace.x_pred, workspace.p_pred
+            else:
+                x_est, p_est, x_pred, p_pred = kalman_filter(x_est, p_est, z, dt_all[i+1])
+            if smooth == 1:
+                history.append(x_pred=x_pred, p_pred=p_pred, x_filt=x_est, p_filt=p_est)
+            # x_true_cat = np.vstack((x_true_cat, np.transpose(x_true[0:2])))
+            trajectory.append(x=x_est[0:2], z=z[0:2])
+    x_smooth = None
+    if smooth == 1:
+        x_smooth, p_smooth = rts_smoother(a, history['x_pred'], history['p_pred'],
+                                          history['x_filt'], history['p_filt'])
+    if show_final == 1:
+        postpross(x_est, p_est, trajectory['x'], trajectory['z'], z, 0, 0, 1, x_smooth)
     print('KF Over')
 
 
 # generate ground truth position x_true and noisy position z
 def gen_measurement(i):
-    x = float(cfs['XX'][(i)+1])
-    y = float(cfs['YY'][(i)+1])
-    ax = float(cfs['ax'][(i)+1])
-    ay = float(cfs['ay'][(i)+1])
-    z = np.array([[x], [y], [ax], [ay]])
-    return z
+    return z_all[i+1].reshape((-1, 1))
 
 
 # linear kalman filter prediction step
@@ -120,20 +190,15 @@ def linear_prediction(a, x_hat, p_hat, q):
 
 # linear kalman filter update step
 def linear_update(x_hat, p_hat, y, h, r):
-    s = h @ p_hat @ np.transpose(h) + r
-    k = p_hat @ np.transpose(h) @ np.linalg.pinv(s)
-    v = y - h @ x_hat
-
-    x_upd = x_hat + k @ v
-    p_upd = p_hat - k @ s @ np.transpose(k)
-    return x_upd, p_upd
+    return linear_kalman_update(x_hat, p_hat, y, h, r)
 
 
-# linear kalman filter
-def kalman_filter(x, p, z):
-    x_pred, p_pred = linear_prediction(a, x, p, q_euler)
+# linear kalman filter over a step of dt_k seconds, also returns the prediction for the smoother
+def kalman_filter(x, p, z, dt_k=dt):
+    a_k, q_k = discretize(dt_k)
+    x_pred, p_pred = linear_prediction(a_k, x, p, q_k)
     x_upd, p_upd = linear_update(x_pred, p_pred, z, h, r)
-    return x_upd, p_upd
+    return x_upd, p_upd, x_pred, p_pred
 
 
 # postprocessing
@@ -153,11 +218,13 @@ def plot_ellipse(x_est, p_est):
     plt.pause(0.00001)
 
 
-def plot_final(x_est_cat, z_cat):
+def plot_final(x_est_cat, z_cat, x_smooth_cat=None):
     fig = plt.figure()
     f = fig.add_subplot(111)
     # f.plot(x_true_cat[0:, 0], x_true_cat[0:, 1], 'r', label='True Position')
     f.plot(x_est_cat[0:, 0], x_est_cat[0:, 1], 'b', label='Estimated Position')
+    if x_smooth_cat is not None:
+        f.plot(x_smooth_cat[0:, 0], x_smooth_cat[0:, 1], 'm', label='Smoothed Position')
     f.plot(z_cat[0:, 0], z_cat[0:, 1], '+g', label='Noisy Measurements')
     f.set_xlabel('x [m]')
     f.set_ylabel('y [m]')
@@ -175,13 +242,15 @@ def plot_animation(x_est, z):
     plt.pause(0.001)
 
 
-def postpross(x_est, p_est, x_est_cat, z_cat, z, show_animation, show_ellipse, show_final_flag):
+def postpross(x_est, p_est, x_est_cat, z_cat, z, show_animation, show_ellipse, show_final_flag,
+              x_smooth_cat=None):
     if show_animation == 1:
         plot_animation(x_est, z)
         if show_ellipse == 1:
             plot_ellipse(x_est[0:2], p_est)
     if show_final_flag == 1:
-        plot_final(x_est_cat, z_cat)
+        plot_final(x_est_cat, z_cat, x_smooth_cat)
 
 
-main()
+if __name__ == '__main__':
+    main()
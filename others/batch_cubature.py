@@ -0,0 +1,91 @@
+# batched cubature kalman filter over K independent tracks
+
+# means are (K, n) and covariances (K, n, n), the models f and h follow the
+# convention of the CKF scripts and receive every point of every track as one
+# (n, K * 2n) matrix, a matrix h is a linear measurement model. rule names the
+# cubature rule of others/sigma_points.py
+
+import numpy as np
+from scipy.linalg import solve_triangular
+
+from others.kalman_update import kalman_gain
+from others.sigma_points import unit_points, factor
+
+
+# lower triangular square roots of a (K, n, n) covariance stack, if a track is not
+# positive definite every track is factored on its own so only that one takes the eigen factor
+def batch_factor(p):
+    try:
+        return np.linalg.cholesky(p)
+    except np.linalg.LinAlgError:
+        return np.stack([factor(p_k) for p_k in p])
+
+
+# cubature points of every track, (K, n, 2n) for the third degree rule
+def batch_sigma(x, p, rule='third'):
+    XI, W = unit_points(np.shape(x)[1], rule)
+    return x[:, :, None] + batch_factor(p) @ XI, W
+
+
+# evaluate g on all points of all tracks in one call
+def batch_apply(g, SP):
+    K, n, m = np.shape(SP)
+    Y = g(np.transpose(SP, (1, 0, 2)).reshape((n, K * m)))
+    return np.transpose(Y.reshape((-1, K, m)), (1, 0, 2))
+
+
+# propagate all points through g, return points (K, m, 2n), means (K, m) and covariances (K, m, m)
+def batch_transform(g, SP, W, noise=None):
+    Y = batch_apply(g, SP)
+    y = Y @ W[0]
+    dY = Y - y[:, :, None]
+    P = (dY * W) @ np.swapaxes(dY, -1, -2)
+    if noise is not None:
+        P = P + noise
+    return Y, y, P
+
+
+# kalman gains P_xy @ inv(s) of every track from the cholesky factors of s and two
+# triangular solves, if a track's s is not positive definite the gains are taken track
+# by track with kalman_gain, which falls back to pinv and reports it for that track only
+def batch_kalman_gain(P_xy, s):
+    try:
+        c = np.linalg.cholesky(s)
+    except np.linalg.LinAlgError:
+        return np.stack([kalman_gain(P_xy_k, s_k) for P_xy_k, s_k in zip(P_xy, s)])
+    k_t = solve_triangular(c, np.swapaxes(P_xy, -1, -2), lower=True, check_finite=False)
+    k_t = solve_triangular(c, k_t, lower=True, trans='T', check_finite=False)
+    return np.swapaxes(k_t, -1, -2)
+
+
+# kalman filter update of every track from y (K, m), s (K, m, m) and P_xy (K, n, m)
+def batch_kalman_update(x_pred, p_pred, z, y, s, P_xy):
+    k = batch_kalman_gain(P_xy, s)
+    x_upd = x_pred + (k @ (z - y)[:, :, None])[:, :, 0]
+    p_upd = p_pred - k @ np.swapaxes(P_xy, -1, -2)
+    return x_upd, p_upd
+
+
+# batched cubature kalman filter prediction step
+def batch_cubature_prediction(x, p, f, q, rule='third'):
+    SP, W = batch_sigma(x, p, rule)
+    _, x_pred, p_pred = batch_transform(f, SP, W, q)
+    return x_pred, p_pred
+
+
+# batched cubature kalman filter update step, z is (K, m)
+def batch_cubature_update(x_pred, p_pred, z, h, r, rule='third'):
+    if isinstance(h, np.ndarray):
+        P_xy = p_pred @ np.transpose(h)
+        s = h @ P_xy + r
+        return batch_kalman_update(x_pred, p_pred, z, x_pred @ np.transpose(h), s, P_xy)
+    SP, W = batch_sigma(x_pred, p_pred, rule)
+    Y, y, s = batch_transform(h, SP, W, r)
+    P_xy = ((SP - x_pred[:, :, None]) * W) @ np.swapaxes(Y - y[:, :, None], -1, -2)
+    return batch_kalman_update(x_pred, p_pred, z, y, s, P_xy)
+
+
+# batched cubature kalman filter
+def batch_cubature_kalman_filter(x, p, z, f, h, q, r, rule='third'):
+    x_pred, p_pred = batch_cubature_prediction(x, p, f, q, rule)
+    return batch_cubature_update(x_pred, p_pred, z, h, r, rule)
@@ -0,0 +1,137 @@
+# code generation of motion models and their jacobians from sympy expressions
+
+# generate() writes others/generated/<name>.py with
+#   f(points, *params)            (m x K) model at the columns of points (n x K)
+#   jacobian(points, *params)     (K x m x n) jacobian at every column
+#   f_jacobian(points, *params)   both at once
+# common subexpressions of the model and its jacobian are computed once. the
+# file records the hash of the expressions it was built from and is only
+# rewritten when the model changes, so the filters import plain numpy code
+# and never need sympy. with jit=True the file also holds scalar loop kernels
+# that replace f and jacobian when numba is installed
+
+import hashlib
+import os
+
+import sympy as sp
+from sympy.printing.numpy import NumPyPrinter
+from sympy.printing.pycode import PythonCodePrinter
+
+# bump to rebuild every generated model after changing the emitted code
+version = 1
+
+generated_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generated')
+
+
+# hash of the model expressions and the generator settings
+def model_hash(state, F, params, jit):
+    text = sp.srepr((tuple(state), sp.Matrix(F), tuple(params))) + repr((version, jit))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# hash recorded in an existing generated file, None if there is none
+def recorded_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        for line in file:
+            if line.startswith('# model hash: '):
+                return line.split(': ', 1)[1].strip()
+    return None
+
+
+# cse temporaries that the expressions depend on, in evaluation order
+def needed_temporaries(temporaries, exprs):
+    needed = set().union(*(sp.sympify(e).free_symbols for e in exprs))
+    kept = []
+    for symbol, expr in reversed(temporaries):
+        if symbol in needed:
+            needed |= expr.free_symbols
+            kept.append((symbol, expr))
+    return kept[::-1]
+
+
+# vectorized numpy function over the columns of points, outputs are (array, target, expr)
+def numpy_function(name, state, params, temporaries, outputs, shapes):
+    printer = NumPyPrinter()
+    lines = ['def %s(%s):' % (name, ', '.join(['points'] + [str(p) for p in params]))]
+    lines += ['    %s = numpy.empty(%s)' % (array, shape) for array, shape in shapes]
+    lines.append('    %s = points' % ', '.join(str(s) for s in state))
+    lines += ['    %s = %s' % (symbol, printer.doprint(expr))
+              for symbol, expr in needed_temporaries(temporaries, [e for _, _, e in outputs])]
+    lines += ['    %s[%s] = %s' % (array, index, printer.doprint(expr)) for array, index, expr in outputs]
+    lines.append('    return ' + ', '.join(array for array, _ in shapes))
+    return lines
+
+
+# scalar loop over the columns of points for numba, indices gain the column k
+def loop_function(name, state, params, temporaries, outputs, shapes):
+    printer = PythonCodePrinter()
+    lines = ['def %s(%s):' % (name, ', '.join(['points'] + [str(p) for p in params]))]
+    lines += ['    %s = numpy.empty(%s)' % (array, shape) for array, shape in shapes]
+    lines.append('    for k in range(numpy.shape(points)[1]):')
+    lines += ['        %s = points[%d, k]' % (s, i) for i, s in enumerate(state)]
+    lines += ['        %s = %s' % (symbol, printer.doprint(expr))
+              for symbol, expr in needed_temporaries(temporaries, [e for _, _, e in outputs])]
+    lines += ['        %s[%s] = %s' % (array, index.replace(':', 'k') if ':' in index else index + ', k',
+                                       printer.doprint(expr)) for array, index, expr in outputs]
+    lines.append('    return ' + ', '.join(array for array, _ in shapes))
+    return lines
+
+
+# source of the generated module for the model F (m x 1) of the symbols state and params
+def model_source(name, state, F, params, jit, digest):
+    F = sp.Matrix(F)
+    J = F.jacobian(sp.Matrix(state))
+    m, n = J.shape
+    temporaries, (F_reduced, J_reduced) = sp.cse(
+        [F, J], symbols=sp.numbered_symbols('cse'), optimizations='basic')
+
+    f_out = [('f', '%d' % i, F_reduced[i]) for i in range(m)]
+    j_out = [('jf', ':, %d, %d' % (i, j), J_reduced[i, j]) for i in range(m) for j in range(n)]
+    f_shape = ('f', '(%d, numpy.shape(points)[1])' % m)
+    j_shape = ('jf', '(numpy.shape(points)[1], %d, %d)' % (m, n))
+    functions = [('f', '%s model (%d x K) at the columns of points (%d x K)' % (name, m, n),
+                  f_out, [f_shape]),
+                 ('jacobian', 'jacobian of the %s model (K x %d x %d)' % (name, m, n),
+                  j_out, [j_shape]),
+                 ('f_jacobian', 'both, sharing their common subexpressions',
+                  f_out + j_out, [f_shape, j_shape])]
+
+    lines = ['# generated by others/codegen.py for the %s model, do not edit' % name,
+             '# model hash: %s' % digest,
+             '',
+             'import math',
+             '',
+             'import numpy']
+    for function, comment, outputs, shapes in functions:
+        lines += ['', '', '# ' + comment]
+        lines += numpy_function(function, state, params, temporaries, outputs, shapes)
+    if jit:
+        for function, comment, outputs, shapes in functions:
+            lines += ['', '']
+            lines += loop_function(function + '_kernel', state, params, temporaries, outputs, shapes)
+        lines += ['', '',
+                  '# numba compiles the loop kernels when it is installed',
+                  'try:',
+                  '    from numba import njit',
+                  'except ImportError:',
+                  '    njit = None',
+                  '',
+                  'if njit is not None:']
+        lines += ['    %s = njit(cache=True)(%s_kernel)' % (function, function)
+                  for function, _, _, _ in functions]
+    return '\n'.join(lines) + '\n'
+
+
+# write others/generated/<name>.py unless it was already built from the same
+# expressions, returns True if the file was rewritten
+def generate(name, state, F, params=(), jit=False):
+    digest = model_hash(state, F, params, jit)
+    path = os.path.join(generated_dir, name + '.py')
+    if recorded_hash(path) == digest:
+        return False
+    os.makedirs(generated_dir, exist_ok=True)
+    with open(path, 'w', newline='\r\n') as file:
+        file.write(model_source(name, state, F, params, jit, digest))
+    return True
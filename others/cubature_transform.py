@@ -0,0 +1,165 @@
+# cubature transform shared by the cubature kalman filter scripts
+
+# the model g is evaluated once on the whole (n x 2n) point matrix and must
+# return the (m x 2n) matrix of propagated points, one column per point. rule
+# names the cubature rule of others/sigma_points.py, the third degree rule by default
+
+import math
+import operator
+
+import numpy as np
+
+from others.kalman_update import kalman_update, linear_kalman_update
+from others.sigma_points import sigma, factor, unit_points
+
+
+# propagate all cubature points through g, return points, weighted mean and covariance
+def cubature_transform(g, SP, W, noise=None):
+    Y = g(SP)
+    y = Y @ np.transpose(W)
+    dY = Y - y
+    P = (dY * W) @ np.transpose(dY)
+    if noise is not None:
+        P = P + noise
+    return Y, y, P
+
+
+# weighted cross covariance between the points SP around x and their images Y around y
+def cross_covariance(SP, x, Y, y, W):
+    return ((SP - x) * W) @ np.transpose(Y - y)
+
+
+# shift a carried point set so its weighted mean is x
+def recenter(SP, W, x):
+    return SP - SP @ np.transpose(W) + x
+
+
+# cubature kalman filter nonlinear prediction step, also returns the propagated points
+def cubature_prediction(x, p, f, q, rule='third'):
+    SP, W = sigma(x, p, rule)
+    Y, x_pred, p_pred = cubature_transform(f, SP, W, q)
+    return x_pred, p_pred, Y, W
+
+
+# prediction step that also returns the cross covariance between x and x_pred,
+# recorded by the forward pass for the cubature smoother
+def cubature_prediction_cross(x, p, f, q, rule='third'):
+    SP, W = sigma(x, p, rule)
+    Y, x_pred, p_pred = cubature_transform(f, SP, W, q)
+    return x_pred, p_pred, Y, W, cross_covariance(SP, x, Y, x_pred, W)
+
+
+class PartialModel:
+    # model a @ x plus g(x[u]) added to the rows v, with u and v slices. g takes the
+    # states u of one point as floats and returns a tuple over the rows v. a, its
+    # transpose and the slices are kept once per model
+    def __init__(self, a, u, v, g):
+        self.a = a
+        self.a_t = np.ascontiguousarray(np.transpose(a))
+        self.u = u
+        self.v = v
+        self.g = g
+
+
+# third degree cubature of g over three states with mean m and covariance p given as
+# floats, written out since numpy calls cost more than the arithmetic of six points.
+# returns the mean and covariance of g and Z = inv(L).T @ XI @ (W * dY).T for the
+# cholesky factor L of p, so that p[:, u] @ Z is the cross covariance of every state
+# with g. None if p is not positive definite
+def third_degree_moments3(g, m, p):
+    (p11, p12, p13), (_, p22, p23), (_, _, p33) = p
+    if p11 <= 0.0:
+        return None
+    l11 = math.sqrt(p11)
+    l21 = p12 / l11
+    l31 = p13 / l11
+    s = p22 - l21 * l21
+    if s <= 0.0:
+        return None
+    l22 = math.sqrt(s)
+    l32 = (p23 - l21 * l31) / l22
+    s = p33 - l31 * l31 - l32 * l32
+    if s <= 0.0:
+        return None
+    l33 = math.sqrt(s)
+    c = math.sqrt(3)
+    m1, m2, m3 = m
+    columns = ((c * l11, c * l21, c * l31), (0.0, c * l22, c * l32), (0.0, 0.0, c * l33))
+    Y = [g(m1 + a, m2 + b, m3 + e) for a, b, e in columns] + \
+        [g(m1 - a, m2 - b, m3 - e) for a, b, e in columns]
+    g_mean, dY, Z = [], [], []
+    for y in zip(*Y):
+        mu = sum(y) / 6
+        e = [t - mu for t in y]
+        z3 = c / 6 * (e[2] - e[5]) / l33
+        z2 = (c / 6 * (e[1] - e[4]) - l32 * z3) / l22
+        z1 = (c / 6 * (e[0] - e[3]) - l21 * z2 - l31 * z3) / l11
+        g_mean.append(mu)
+        dY.append(e)
+        Z.append((z1, z2, z3))
+    P_gg = [[sum(map(operator.mul, e, f)) / 6 for f in dY] for e in dY]
+    return g_mean, P_gg, list(zip(*Z))
+
+
+# the same moments for any number of states, an eigen factor of p if it is only
+# positive semidefinite and pinv in place of inv
+def third_degree_moments(g, m, p):
+    L = factor(np.array(p))
+    XI, W = unit_points(len(m))
+    SP = np.transpose(np.array(m)[:, None] + L @ XI)
+    Y = np.transpose([g(*point) for point in SP.tolist()])
+    g_mean = Y @ W[0]
+    dY = Y - g_mean[:, None]
+    P_gg = (dY * W) @ np.transpose(dY)
+    Z = np.transpose(np.linalg.pinv(L)) @ XI @ np.transpose(dY * W)
+    return g_mean, P_gg, Z
+
+
+# cubature kalman filter prediction through a PartialModel with the third degree rule,
+# the cubature runs over the states u only. with the cross covariance P_xg of x and g
+#   x_pred = a @ x + E[g],  p_pred = a @ p @ a.T + q + a @ P_xg + P_xg.T @ a.T + P_gg
+# where a @ P_xg only fills the columns v. the cross covariance of x and the
+# prediction for the smoother is only built if cross is set
+def partial_cubature_prediction(model, x, p, q, cross=False):
+    u, v = model.u, model.v
+    m = x[u, 0].tolist()
+    p_uu = p[u, u].tolist()
+    moments = third_degree_moments3(model.g, m, p_uu) if len(m) == 3 else None
+    if moments is None:
+        moments = third_degree_moments(model.g, m, p_uu)
+    g_mean, P_gg, Z = moments
+    P_xg = p[:, u] @ Z
+    M = model.a @ P_xg
+    x_pred = model.a @ x
+    x_pred[v, 0] += g_mean
+    p_pred = model.a @ p @ model.a_t + q
+    p_pred[:, v] += M
+    p_pred[v] += np.transpose(M)
+    p_pred[v, v] += P_gg
+    if not cross:
+        return x_pred, p_pred
+    c = p @ model.a_t
+    c[:, v] += P_xg
+    return x_pred, p_pred, c
+
+
+# exact kalman filter update step for a linear measurement model z = hx @ x
+def linear_update(x_pred, p_pred, z, hx, r):
+    return linear_kalman_update(x_pred, p_pred, z, hx, r)
+
+
+# cubature kalman filter nonlinear update step
+# a matrix h is a linear measurement model and takes the exact linear update, SP and W
+# are then ignored. for a nonlinear h points are regenerated from p_pred unless a carried
+# point set SP, W is passed in, carried points from the prediction do not include the
+# spread added by q
+def cubature_update(x_pred, p_pred, z, h, r, SP=None, W=None, recenter_points=False, rule='third'):
+    if isinstance(h, np.ndarray):
+        return linear_update(x_pred, p_pred, z, h, r)
+    if SP is None:
+        SP, W = sigma(x_pred, p_pred, rule)
+    elif recenter_points:
+        SP = recenter(SP, W, x_pred)
+    Y, y_k, s = cubature_transform(h, SP, W, r)
+    P_xy = cross_covariance(SP, x_pred, Y, y_k, W)
+    return kalman_update(x_pred, p_pred, z, y_k, s, P_xy)
@@ -0,0 +1,55 @@
+# exact discretization of the continuous time linear models for a variable time step
+
+# the transition matrix and process noise covariance of a step dt come from one
+# matrix exponential (van loan, computing integrals involving the matrix
+# exponential, 1978)
+#   expm([[-a, q], [0, a.T]] * dt) = [[., inv(a_d) @ q_d], [0, a_d.T]]
+# steps are cached by dt quantized to resolution, so jittery timestamps share
+# a handful of exponentials instead of one per sample
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy.linalg import expm
+
+
+# transition matrix a_d and process noise covariance q_d of the continuous model a, q over dt
+def van_loan(a, q, dt):
+    n = np.shape(a)[0]
+    c = np.zeros((2 * n, 2 * n))
+    c[:n, :n] = -a
+    c[:n, n:] = q
+    c[n:, n:] = np.transpose(a)
+    m = expm(c * dt)
+    a_d = np.transpose(m[n:, n:])
+    q_d = a_d @ m[:n, n:]
+    return a_d, (q_d + np.transpose(q_d)) / 2
+
+
+class Discretization:
+    # a, q are the continuous time model and process noise covariance, at most
+    # maxsize steps are kept and the least recently used one is dropped first
+    def __init__(self, a, q, resolution=1e-4, maxsize=128):
+        self.a = a
+        self.q = q
+        self.resolution = resolution
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # read only a_d, q_d of the step dt
+    def __call__(self, dt):
+        key = int(round(dt / self.resolution))
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.misses += 1
+        a_d, q_d = van_loan(self.a, self.q, key * self.resolution)
+        a_d.setflags(write=False)
+        q_d.setflags(write=False)
+        self.cache[key] = (a_d, q_d)
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return a_d, q_d
@@ -0,0 +1,139 @@
+# kalman filter steps that write into preallocated buffers
+
+# a Workspace holds every intermediate of one filter step for n states and m
+# measurement rows: the factor of p, the cubature points and their images, the
+# predicted moments, the predicted measurement, the innovation and its covariance
+# and the gain. the steps only use out= arguments and the in place lapack cholesky,
+# so a filter loop creates no new arrays once the workspace exists
+#
+# the model f(points, out) has to write its images into out, the CTRV and CTRA
+# models of others/motion_models.py do. their numpy form still builds elementwise
+# temporaries, the numba kernels write straight into out
+#
+# a z with missing (NaN) channels is handed to linear_kalman_update and copied into
+# the outputs. the selector rows of the measurement model h given to the workspace
+# are resolved once, any other h is looked up per step
+
+import warnings
+import numpy as np
+from scipy.linalg.lapack import dpotrf, dpotrs
+
+from others import kalman_update
+from others.kalman_update import InnovationCovarianceWarning, selector_rows, linear_kalman_update
+from others.sigma_points import unit_points
+
+
+class Workspace:
+    # buffers of one step for n states and m measurement rows with the cubature rule,
+    # h is the measurement model the steps are usually called with
+    def __init__(self, n, m, rule='third', h=None):
+        self.h = h
+        self.rows = None if h is None else selector_rows(h)
+        self.XI, self.W = unit_points(n, rule)
+        self.W_col = np.ascontiguousarray(np.transpose(self.W))
+        K = np.shape(self.XI)[1]
+        self.L = np.zeros((n, n), order='F')
+        self.SP = np.empty((n, K))
+        self.Y = np.empty((n, K))
+        self.dY = np.empty((n, K))
+        self.dYW = np.empty((n, K))
+        self.ap = np.empty((n, n))
+        self.x_pred = np.empty((n, 1))
+        self.p_pred = np.empty((n, n))
+        self.y = np.empty((m, 1))
+        self.innovation = np.empty((m, 1))
+        self.missing = np.empty((m, 1), dtype=bool)
+        self.s = np.empty((m, m))
+        self.s_factor = np.zeros((m, m), order='F')
+        self.P_xy = np.empty((n, m))
+        self.k_t = np.zeros((m, n), order='F')
+
+
+# cholesky factor of p into ws.L, eigen factor if p is not positive definite
+def factor_into(ws, p):
+    np.copyto(ws.L, p)
+    _, info = dpotrf(ws.L, lower=1, clean=1, overwrite_a=1)
+    if info != 0:
+        d, V = np.linalg.eigh((p + np.transpose(p)) / 2)
+        np.copyto(ws.L, V * np.sqrt(np.clip(d, 0.0, None)))
+    return ws.L
+
+
+# cubature prediction of x, p through f into ws.x_pred, ws.p_pred
+def cubature_prediction_into(ws, x, p, f, q):
+    np.matmul(factor_into(ws, p), ws.XI, out=ws.SP)
+    ws.SP += x
+    f(ws.SP, ws.Y)
+    np.matmul(ws.Y, ws.W_col, out=ws.x_pred)
+    np.subtract(ws.Y, ws.x_pred, out=ws.dY)
+    np.multiply(ws.dY, ws.W, out=ws.dYW)
+    np.matmul(ws.dYW, np.transpose(ws.dY), out=ws.p_pred)
+    ws.p_pred += q
+    return ws.x_pred, ws.p_pred
+
+
+# linear prediction x = a @ x, p = a @ p @ a.T + q into ws.x_pred, ws.p_pred
+def linear_prediction_into(ws, x, p, a, q):
+    np.matmul(a, x, out=ws.x_pred)
+    np.matmul(a, p, out=ws.ap)
+    np.matmul(ws.ap, np.transpose(a), out=ws.p_pred)
+    ws.p_pred += q
+    return ws.x_pred, ws.p_pred
+
+
+# transposed kalman gain inv(ws.s) @ ws.P_xy.T into ws.k_t, pinv is only used
+# if ws.s is not positive definite and counts as a fallback of others/kalman_update.py
+def gain_into(ws):
+    np.copyto(ws.k_t, np.transpose(ws.P_xy))
+    np.copyto(ws.s_factor, ws.s)
+    _, info = dpotrf(ws.s_factor, lower=1, clean=0, overwrite_a=1)
+    if info == 0:
+        dpotrs(ws.s_factor, ws.k_t, lower=1, overwrite_b=1)
+        return ws.k_t
+    kalman_update.fallback_count += 1
+    warnings.warn('innovation covariance is not positive definite, using pinv',
+                  InnovationCovarianceWarning, stacklevel=3)
+    np.copyto(ws.k_t, np.linalg.pinv(ws.s) @ np.transpose(ws.P_xy))
+    return ws.k_t
+
+
+# kalman update of x_pred, p_pred with the linear measurement model h into x_out,
+# p_out, which must not be x_pred and p_pred. a selector h is gathered
+def linear_update_into(ws, x_pred, p_pred, z, h, r, x_out, p_out):
+    if np.isnan(z, out=ws.missing).any():
+        x_upd, p_upd = linear_kalman_update(x_pred, p_pred, z, h, r)
+        np.copyto(x_out, x_upd)
+        np.copyto(p_out, p_upd)
+        return x_out, p_out
+    rows = ws.rows if h is ws.h else selector_rows(h)
+    if rows is None:
+        np.matmul(p_pred, np.transpose(h), out=ws.P_xy)
+        np.matmul(h, ws.P_xy, out=ws.s)
+        np.matmul(h, x_pred, out=ws.y)
+    else:
+        np.take(p_pred, rows, axis=1, out=ws.P_xy, mode='clip')
+        np.take(ws.P_xy, rows, axis=0, out=ws.s, mode='clip')
+        np.take(x_pred, rows, axis=0, out=ws.y, mode='clip')
+    ws.s += r
+    np.subtract(z, ws.y, out=ws.innovation)
+    k = np.transpose(gain_into(ws))
+    np.matmul(k, ws.innovation, out=x_out)
+    x_out += x_pred
+    np.matmul(k, np.transpose(ws.P_xy), out=p_out)
+    np.subtract(p_pred, p_out, out=p_out)
+    return x_out, p_out
+
+
+# cubature kalman filter step with a linear measurement model, x and p are
+# overwritten with the update unless x_out and p_out are given
+def cubature_step(ws, x, p, z, f, q, h, r, x_out=None, p_out=None):
+    x_pred, p_pred = cubature_prediction_into(ws, x, p, f, q)
+    return linear_update_into(ws, x_pred, p_pred, z, h, r,
+                              x if x_out is None else x_out, p if p_out is None else p_out)
+
+
+# linear kalman filter step, x and p are overwritten with the update unless x_out and p_out are given
+def kalman_step(ws, x, p, z, a, q, h, r, x_out=None, p_out=None):
+    x_pred, p_pred = linear_prediction_into(ws, x, p, a, q)
+    return linear_update_into(ws, x_pred, p_pred, z, h, r,
+                              x if x_out is None else x_out, p if p_out is None else p_out)
@@ -0,0 +1,49 @@
+# event driven scheduler for fusing asynchronous sensor streams
+
+# every sensor is a time ordered stream of (times, values). a heap holds the
+# next event of each stream, so the streams are merged in time order without
+# resampling them to a common rate. events that share a time stamp form one
+# group, the filter predicts once to that time and applies a single update
+# stacked from the rows of every sensor in the group
+
+import heapq
+
+import numpy as np
+from scipy.linalg import block_diag
+
+
+# time ordered (t, name, value) events of all streams, streams maps a sensor name
+# to its times (K) and values (K x m)
+def merge_streams(streams):
+    heap = [(times[0], name, 0) for name, (times, values) in streams.items() if len(times) > 0]
+    heapq.heapify(heap)
+    while heap:
+        t, name, i = heapq.heappop(heap)
+        times, values = streams[name]
+        if i + 1 < len(times):
+            heapq.heappush(heap, (times[i + 1], name, i + 1))
+        yield t, name, values[i]
+
+
+# (t, [(name, value), ...]) groups of events closer than tol seconds to the first of the group
+def event_groups(streams, tol=1e-9):
+    group = []
+    t_group = None
+    for t, name, value in merge_streams(streams):
+        if group and t - t_group > tol:
+            yield t_group, group
+            group = []
+        if not group:
+            t_group = t
+        group.append((name, value))
+    if group:
+        yield t_group, group
+
+
+# stacked measurement z, model h and noise covariance r of a group of events,
+# sensors maps a sensor name to its linear measurement model h and covariance r
+def stack_update(events, sensors):
+    z = np.concatenate([np.reshape(value, (-1, 1)) for _, value in events])
+    h = np.vstack([sensors[name][0] for name, _ in events])
+    r = block_diag(*[sensors[name][1] for name, _ in events])
+    return z, h, r
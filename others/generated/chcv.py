@@ -0,0 +1,175 @@
+# generated by others/codegen.py for the chcv model, do not edit
+# model hash: 6be64d793886f5c47ae0a3fc9aff046bd4bd662b3415a34b7aef85c564a08a6f
+
+import math
+
+import numpy
+
+
+# chcv model (4 x K) at the columns of points (4 x K)
+def f(points, T):
+    f = numpy.empty((4, numpy.shape(points)[1]))
+    x, y, psi, v = points
+    cse0 = T*numpy.cos(psi)
+    cse1 = cse0*v
+    cse2 = T*numpy.sin(psi)
+    cse3 = cse2*v
+    f[0] = cse1 + x
+    f[1] = cse3 + y
+    f[2] = psi
+    f[3] = v
+    return f
+
+
+# jacobian of the chcv model (K x 4 x 4)
+def jacobian(points, T):
+    jf = numpy.empty((numpy.shape(points)[1], 4, 4))
+    x, y, psi, v = points
+    cse0 = T*numpy.cos(psi)
+    cse1 = cse0*v
+    cse2 = T*numpy.sin(psi)
+    cse3 = cse2*v
+    jf[:, 0, 0] = 1
+    jf[:, 0, 1] = 0
+    jf[:, 0, 2] = -cse3
+    jf[:, 0, 3] = cse0
+    jf[:, 1, 0] = 0
+    jf[:, 1, 1] = 1
+    jf[:, 1, 2] = cse1
+    jf[:, 1, 3] = cse2
+    jf[:, 2, 0] = 0
+    jf[:, 2, 1] = 0
+    jf[:, 2, 2] = 1
+    jf[:, 2, 3] = 0
+    jf[:, 3, 0] = 0
+    jf[:, 3, 1] = 0
+    jf[:, 3, 2] = 0
+    jf[:, 3, 3] = 1
+    return jf
+
+
+# both, sharing their common subexpressions
+def f_jacobian(points, T):
+    f = numpy.empty((4, numpy.shape(points)[1]))
+    jf = numpy.empty((numpy.shape(points)[1], 4, 4))
+    x, y, psi, v = points
+    cse0 = T*numpy.cos(psi)
+    cse1 = cse0*v
+    cse2 = T*numpy.sin(psi)
+    cse3 = cse2*v
+    f[0] = cse1 + x
+    f[1] = cse3 + y
+    f[2] = psi
+    f[3] = v
+    jf[:, 0, 0] = 1
+    jf[:, 0, 1] = 0
+    jf[:, 0, 2] = -cse3
+    jf[:, 0, 3] = cse0
+    jf[:, 1, 0] = 0
+    jf[:, 1, 1] = 1
+    jf[:, 1, 2] = cse1
+    jf[:, 1, 3] = cse2
+    jf[:, 2, 0] = 0
+    jf[:, 2, 1] = 0
+    jf[:, 2, 2] = 1
+    jf[:, 2, 3] = 0
+    jf[:, 3, 0] = 0
+    jf[:, 3, 1] = 0
+    jf[:, 3, 2] = 0
+    jf[:, 3, 3] = 1
+    return f, jf
+
+
+def f_kernel(points, T):
+    f = numpy.empty((4, numpy.shape(points)[1]))
+    for k in range(numpy.shape(points)[1]):
+        x = points[0, k]
+        y = points[1, k]
+        psi = points[2, k]
+        v = points[3, k]
+        cse0 = T*math.cos(psi)
+        cse1 = cse0*v
+        cse2 = T*math.sin(psi)
+        cse3 = cse2*v
+        f[0, k] = cse1 + x
+        f[1, k] = cse3 + y
+        f[2, k] = psi
+        f[3, k] = v
+    return f
+
+
+def jacobian_kernel(points, T):
+    jf = numpy.empty((numpy.shape(points)[1], 4, 4))
+    for k in range(numpy.shape(points)[1]):
+        x = points[0, k]
+        y = points[1, k]
+        psi = points[2, k]
+        v = points[3, k]
+        cse0 = T*math.cos(psi)
+        cse1 = cse0*v
+        cse2 = T*math.sin(psi)
+        cse3 = cse2*v
+        jf[k, 0, 0] = 1
+        jf[k, 0, 1] = 0
+        jf[k, 0, 2] = -cse3
+        jf[k, 0, 3] = cse0
+        jf[k, 1, 0] = 0
+        jf[k, 1, 1] = 1
+        jf[k, 1, 2] = cse1
+        jf[k, 1, 3] = cse2
+        jf[k, 2, 0] = 0
+        jf[k, 2, 1] = 0
+        jf[k, 2, 2] = 1
+        jf[k, 2, 3] = 0
+        jf[k, 3, 0] = 0
+        jf[k, 3, 1] = 0
+        jf[k, 3, 2] = 0
+        jf[k, 3, 3] = 1
+    return jf
+
+
+def f_jacobian_kernel(points, T):
+    f = numpy.empty((4, numpy.shape(points)[1]))
+    jf = numpy.empty((numpy.shape(points)[1], 4, 4))
+    for k in range(numpy.shape(points)[1]):
+        x = points[0, k]
+        y = points[1, k]
+        psi = points[2, k]
+        v = points[3, k]
+        cse0 = T*math.cos(psi)
+        cse1 = cse0*v
+        cse2 = T*math.sin(psi)
+        cse3 = cse2*v
+        f[0, k] = cse1 + x
+        f[1, k] = cse3 + y
+        f[2, k] = psi
+        f[3, k] = v
+        jf[k, 0, 0] = 1
+        jf[k, 0, 1] = 0
+        jf[k, 0, 2] = -cse3
+        jf[k, 0, 3] = cse0
+        jf[k, 1, 0] = 0
+        jf[k, 1, 1] = 1
+        jf[k, 1, 2] = cse1
+        jf[k, 1, 3] = cse2
+        jf[k, 2, 0] = 0
+        jf[k, 2, 1] = 0
+        jf[k, 2, 2] = 1
+        jf[k, 2, 3] = 0
+        jf[k, 3, 0] = 0
+        jf[k, 3, 1] = 0
+        jf[k, 3, 2] = 0
+        jf[k, 3, 3] = 1
+    return f, jf
+
+
+# numba compiles the loop kernels when it is installed
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    f = njit(cache=True)(f_kernel)
+    jacobian = njit(cache=True)(jacobian_kernel)
+    f_jacobian = njit(cache=True)(f_jacobian_kernel)
@@ -0,0 +1,218 @@
+# generated by others/codegen.py for the ct model, do not edit
+# model hash: b6d45a6e81604d9c58f4d72f4f0240dbdca9bbf5448a97ddda4aa323f16736f2
+
+import math
+
+import numpy
+
+
+# ct model (5 x K) at the columns of points (5 x K)
+def f(points, T):
+    f = numpy.empty((5, numpy.shape(points)[1]))
+    x, y, v, psi, dpsi = points
+    cse0 = T*numpy.cos(psi)
+    cse1 = cse0*v
+    cse2 = T*numpy.sin(psi)
+    cse3 = cse2*v
+    f[0] = cse1 + x
+    f[1] = cse3 + y
+    f[2] = v
+    f[3] = T*dpsi + psi
+    f[4] = dpsi
+    return f
+
+
+# jacobian of the ct model (K x 5 x 5)
+def jacobian(points, T):
+    jf = numpy.empty((numpy.shape(points)[1], 5, 5))
+    x, y, v, psi, dpsi = points
+    cse0 = T*numpy.cos(psi)
+    cse1 = cse0*v
+    cse2 = T*numpy.sin(psi)
+    cse3 = cse2*v
+    jf[:, 0, 0] = 1
+    jf[:, 0, 1] = 0
+    jf[:, 0, 2] = cse0
+    jf[:, 0, 3] = -cse3
+    jf[:, 0, 4] = 0
+    jf[:, 1, 0] = 0
+    jf[:, 1, 1] = 1
+    jf[:, 1, 2] = cse2
+    jf[:, 1, 3] = cse1
+    jf[:, 1, 4] = 0
+    jf[:, 2, 0] = 0
+    jf[:, 2, 1] = 0
+    jf[:, 2, 2] = 1
+    jf[:, 2, 3] = 0
+    jf[:, 2, 4] = 0
+    jf[:, 3, 0] = 0
+    jf[:, 3, 1] = 0
+    jf[:, 3, 2] = 0
+    jf[:, 3, 3] = 1
+    jf[:, 3, 4] = T
+    jf[:, 4, 0] = 0
+    jf[:, 4, 1] = 0
+    jf[:, 4, 2] = 0
+    jf[:, 4, 3] = 0
+    jf[:, 4, 4] = 1
+    return jf
+
+
+# both, sharing their common subexpressions
+def f_jacobian(points, T):
+    f = numpy.empty((5, numpy.shape(points)[1]))
+    jf = numpy.empty((numpy.shape(points)[1], 5, 5))
+    x, y, v, psi, dpsi = points
+    cse0 = T*numpy.cos(psi)
+    cse1 = cse0*v
+    cse2 = T*numpy.sin(psi)
+    cse3 = cse2*v
+    f[0] = cse1 + x
+    f[1] = cse3 + y
+    f[2] = v
+    f[3] = T*dpsi + psi
+    f[4] = dpsi
+    jf[:, 0, 0] = 1
+    jf[:, 0, 1] = 0
+    jf[:, 0, 2] = cse0
+    jf[:, 0, 3] = -cse3
+    jf[:, 0, 4] = 0
+    jf[:, 1, 0] = 0
+    jf[:, 1, 1] = 1
+    jf[:, 1, 2] = cse2
+    jf[:, 1, 3] = cse1
+    jf[:, 1, 4] = 0
+    jf[:, 2, 0] = 0
+    jf[:, 2, 1] = 0
+    jf[:, 2, 2] = 1
+    jf[:, 2, 3] = 0
+    jf[:, 2, 4] = 0
+    jf[:, 3, 0] = 0
+    jf[:, 3, 1] = 0
+    jf[:, 3, 2] = 0
+    jf[:, 3, 3] = 1
+    jf[:, 3, 4] = T
+    jf[:, 4, 0] = 0
+    jf[:, 4, 1] = 0
+    jf[:, 4, 2] = 0
+    jf[:, 4, 3] = 0
+    jf[:, 4, 4] = 1
+    return f, jf
+
+
+def f_kernel(points, T):
+    f = numpy.empty((5, numpy.shape(points)[1]))
+    for k in range(numpy.shape(points)[1]):
+        x = points[0, k]
+        y = points[1, k]
+        v = points[2, k]
+        psi = points[3, k]
+        dpsi = points[4, k]
+        cse0 = T*math.cos(psi)
+        cse1 = cse0*v
+        cse2 = T*math.sin(psi)
+        cse3 = cse2*v
+        f[0, k] = cse1 + x
+        f[1, k] = cse3 + y
+        f[2, k] = v
+        f[3, k] = T*dpsi + psi
+        f[4, k] = dpsi
+    return f
+
+
+def jacobian_kernel(points, T):
+    jf = numpy.empty((numpy.shape(points)[1], 5, 5))
+    for k in range(numpy.shape(points)[1]):
+        x = points[0, k]
+        y = points[1, k]
+        v = points[2, k]
+        psi = points[3, k]
+        dpsi = points[4, k]
+        cse0 = T*math.cos(psi)
+        cse1 = cse0*v
+        cse2 = T*math.sin(psi)
+        cse3 = cse2*v
+        jf[k, 0, 0] = 1
+        jf[k, 0, 1] = 0
+        jf[k, 0, 2] = cse0
+        jf[k, 0, 3] = -cse3
+        jf[k, 0, 4] = 0
+        jf[k, 1, 0] = 0
+        jf[k, 1, 1] = 1
+        jf[k, 1, 2] = cse2
+        jf[k, 1, 3] = cse1
+        jf[k, 1, 4] = 0
+        jf[k, 2, 0] = 0
+        jf[k, 2, 1] = 0
+        jf[k, 2, 2] = 1
+        jf[k, 2, 3] = 0
+        jf[k, 2, 4] = 0
+        jf[k, 3, 0] = 0
+        jf[k, 3, 1] = 0
+        jf[k, 3, 2] = 0
+        jf[k, 3, 3] = 1
+        jf[k, 3, 4] = T
+        jf[k, 4, 0] = 0
+        jf[k, 4, 1] = 0
+        jf[k, 4, 2] = 0
+        jf[k, 4, 3] = 0
+        jf[k, 4, 4] = 1
+    return jf
+
+
+def f_jacobian_kernel(points, T):
+    f = numpy.empty((5, numpy.shape(points)[1]))
+    jf = numpy.empty((numpy.shape(points)[1], 5, 5))
+    for k in range(numpy.shape(points)[1]):
+        x = points[0, k]
+        y = points[1, k]
+        v = points[2, k]
+        psi = points[3, k]
+        dpsi = points[4, k]
+        cse0 = T*math.cos(psi)
+        cse1 = cse0*v
+        cse2 = T*math.sin(psi)
+        cse3 = cse2*v
+        f[0, k] = cse1 + x
+        f[1, k] = cse3 + y
+        f[2, k] = v
+        f[3, k] = T*dpsi + psi
+        f[4, k] = dpsi
+        jf[k, 0, 0] = 1
+        jf[k, 0, 1] = 0
+        jf[k, 0, 2] = cse0
+        jf[k, 0, 3] = -cse3
+        jf[k, 0, 4] = 0
+        jf[k, 1, 0] = 0
+        jf[k, 1, 1] = 1
+        jf[k, 1, 2] = cse2
+        jf[k, 1, 3] = cse1
+        jf[k, 1, 4] = 0
+        jf[k, 2, 0] = 0
+        jf[k, 2, 1] = 0
+        jf[k, 2, 2] = 1
+        jf[k, 2, 3] = 0
+        jf[k, 2, 4] = 0
+        jf[k, 3, 0] = 0
+        jf[k, 3, 1] = 0
+        jf[k, 3, 2] = 0
+        jf[k, 3, 3] = 1
+        jf[k, 3, 4] = T
+        jf[k, 4, 0] = 0
+        jf[k, 4, 1] = 0
+        jf[k, 4, 2] = 0
+        jf[k, 4, 3] = 0
+        jf[k, 4, 4] = 1
+    return f, jf
+
+
+# numba compiles the loop kernels when it is installed
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    f = njit(cache=True)(f_kernel)
+    jacobian = njit(cache=True)(jacobian_kernel)
+    f_jacobian = njit(cache=True)(f_jacobian_kernel)
@@ -1,28 +1,45 @@
+# symbolic motion models, run this file to regenerate their compiled model and
+# jacobian code in others/generated after changing a model
+
+# CTRV and CTRA are not generated, their v / dpsi arc is singular at zero yaw rate
+# and others/motion_models.py writes them out in the sinc form instead
+
+import os
+import sys
+
 import sympy as sp
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from others.codegen import generate
+
 x, y, psi, v, dpsi, T = sp.symbols('x y psi v dpsi T')
 
-state = sp.Matrix([x,
-                   y,
-                   psi,
-                   v,
-                   dpsi])
 
-F = sp.Matrix([[x + (v/dpsi) * (sp.sin(T * dpsi + psi) - sp.sin(psi))],
-               [y + (v/dpsi) * (sp.cos(psi) - sp.cos(T * dpsi + psi))],
-               [T * dpsi + psi],
-               [v],
-               [dpsi]])
+# CT model, state x, y, velocity, yaw, yaw rate
+def ct_model():
+    state = [x, y, v, psi, dpsi]
+    F = sp.Matrix([[x + T * v * sp.cos(psi)],
+                   [y + T * v * sp.sin(psi)],
+                   [v],
+                   [psi + T * dpsi],
+                   [dpsi]])
+    return state, F, [T]
+
 
-jF = F.jacobian(state)
+# CHCV model, state x, y, yaw, velocity
+def chcv_model():
+    state = [x, y, psi, v]
+    F = sp.Matrix([[x + T * v * sp.cos(psi)],
+                   [y + T * v * sp.sin(psi)],
+                   [psi],
+                   [v]])
+    return state, F, [T]
 
-# print(F[0], '\n', F[1], '\n', F[2], '\n', F[3], '\n',F[4])
 
-# for i in range(0, 5):
-#     print(jF[i, 0], ' ', jF[i, 1], ' ', jF[i, 2],
-#           ' ', jF[i, 3], ' ', jF[i, 4], ' ')
+models = {'ct': ct_model, 'chcv': chcv_model}
 
-h = sp.Matrix([sp.sqrt(x), sp.sqrt(y)])
-jH = h.jacobian(state)
 
-print(jF)
+if __name__ == '__main__':
+    for name, model in models.items():
+        state, F, params = model()
+        print(name, 'generated' if generate(name, state, F, params, jit=True) else 'up to date')
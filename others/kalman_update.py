@@ -0,0 +1,185 @@
+# kalman filter update step shared by the linear, extended and cubature kalman filter scripts
+
+# the innovation covariance s is factored once with cholesky and the factor is
+# reused for the gain and the covariance update, pinv is only used if s is not
+# positive definite and each such fallback is reported with a warning
+
+# a linear measurement with diagonal noise r has independent channels and can be
+# processed one channel at a time, each a scalar update that divides by the
+# scalar innovation variance instead of factoring s. the python loop over the
+# channels is slower than one cholesky update, so the sequential update is only
+# the default when numba compiles it, set use_sequential to choose. channels that
+# are NaN in z are missing in that row and are skipped by both updates
+
+# most measurement models only pick states, every row of h is zero except for a
+# single one. h @ x, h @ p @ h.T and p @ h.T are then gathers of the picked rows
+# and columns, only a general h takes the dense products
+
+import warnings
+from functools import lru_cache
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, LinAlgError
+
+# number of updates that fell back to pinv
+fallback_count = 0
+
+
+class InnovationCovarianceWarning(RuntimeWarning):
+    pass
+
+
+# kalman gain P_xy @ inv(s)
+def kalman_gain(P_xy, s):
+    global fallback_count
+    try:
+        c = cho_factor(s, lower=True, check_finite=False)
+        return np.transpose(cho_solve(c, np.transpose(P_xy), check_finite=False))
+    except LinAlgError:
+        fallback_count += 1
+        warnings.warn('innovation covariance is not positive definite, using pinv',
+                      InnovationCovarianceWarning, stacklevel=3)
+        return P_xy @ np.linalg.pinv(s)
+
+
+# kalman filter update step from the predicted measurement y, innovation covariance s
+# and state-measurement cross covariance P_xy
+def kalman_update(x_pred, p_pred, z, y, s, P_xy):
+    k = kalman_gain(P_xy, s)
+    x_upd = x_pred + k @ (z - y)
+    p_upd = p_pred - k @ np.transpose(P_xy)
+    return x_upd, p_upd
+
+
+# true if r has no nonzero off diagonal entry
+def is_diagonal(r):
+    return np.count_nonzero(r) == np.count_nonzero(np.diagonal(r))
+
+
+# state indices picked by the rows of h if h is a 0/1 row selector, otherwise None
+def selector_rows(h):
+    return selector_rows_of(np.shape(h), np.asarray(h, dtype=float).tobytes())
+
+
+# selector_rows from the shape and bytes of h, cached as the models are constant
+@lru_cache(maxsize=32)
+def selector_rows_of(shape, data):
+    h = np.frombuffer(data).reshape(shape)
+    ones = h == 1.0
+    if np.count_nonzero(h) != shape[0] or not np.all(np.count_nonzero(ones, axis=1) == 1):
+        return None
+    rows = np.argmax(ones, axis=1)
+    rows.flags.writeable = False
+    return rows
+
+
+# kalman filter update of the linear model h with diagonal noise r as one scalar
+# update per channel of z, NaN channels are skipped
+def sequential_update(x_pred, p_pred, z, h, r):
+    r_diag = np.diagonal(r).tolist()
+    x_upd = x_pred[:, 0].copy()
+    p_upd = p_pred.copy()
+    for i, z_i in enumerate(z[:, 0].tolist()):
+        if z_i != z_i:
+            continue
+        hp = h[i] @ p_upd
+        k = hp / (float(hp @ h[i]) + r_diag[i])
+        x_upd += k * (z_i - float(h[i] @ x_upd))
+        p_upd -= np.multiply.outer(k, hp)
+    return x_upd[:, None], p_upd
+
+
+# loop form of sequential_update for numba
+def sequential_update_kernel(x_pred, p_pred, z, h, r):
+    n = np.shape(p_pred)[0]
+    x_upd = x_pred.copy()
+    p_upd = p_pred.copy()
+    hp = np.empty(n)
+    for i in range(np.shape(z)[0]):
+        if np.isnan(z[i, 0]):
+            continue
+        s = r[i, i]
+        y = 0.0
+        for a in range(n):
+            hp[a] = 0.0
+            for b in range(n):
+                hp[a] += h[i, b] * p_upd[b, a]
+            s += hp[a] * h[i, a]
+            y += h[i, a] * x_upd[a, 0]
+        innovation = (z[i, 0] - y) / s
+        for a in range(n):
+            x_upd[a, 0] += hp[a] * innovation
+            for b in range(n):
+                p_upd[a, b] -= hp[a] * hp[b] / s
+    return x_upd, p_upd
+
+
+# sequential_update of the selector model that picks the states rows
+def selected_sequential_update(x_pred, p_pred, z, rows, r):
+    r_diag = np.diagonal(r).tolist()
+    x_upd = x_pred[:, 0].copy()
+    p_upd = p_pred.copy()
+    for i, (z_i, j) in enumerate(zip(z[:, 0].tolist(), rows.tolist())):
+        if z_i != z_i:
+            continue
+        hp = p_upd[j].copy()
+        k = hp / (hp[j] + r_diag[i])
+        x_upd += k * (z_i - x_upd[j])
+        p_upd -= np.multiply.outer(k, hp)
+    return x_upd[:, None], p_upd
+
+
+# loop form of selected_sequential_update for numba
+def selected_sequential_update_kernel(x_pred, p_pred, z, rows, r):
+    n = np.shape(p_pred)[0]
+    x_upd = x_pred.copy()
+    p_upd = p_pred.copy()
+    hp = np.empty(n)
+    for i in range(np.shape(z)[0]):
+        if np.isnan(z[i, 0]):
+            continue
+        j = rows[i]
+        for a in range(n):
+            hp[a] = p_upd[j, a]
+        s = hp[j] + r[i, i]
+        innovation = (z[i, 0] - x_upd[j, 0]) / s
+        for a in range(n):
+            x_upd[a, 0] += hp[a] * innovation
+            for b in range(n):
+                p_upd[a, b] -= hp[a] * hp[b] / s
+    return x_upd, p_upd
+
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    sequential_update = njit(cache=True)(sequential_update_kernel)
+    selected_sequential_update = njit(cache=True)(selected_sequential_update_kernel)
+
+# diagonal r takes the sequential update
+use_sequential = njit is not None
+
+
+# exact kalman filter update step for the linear measurement model z = h @ x,
+# sequential for diagonal r if use_sequential, otherwise the full update of the
+# channels present in z
+def linear_kalman_update(x_pred, p_pred, z, h, r):
+    rows = selector_rows(h)
+    if use_sequential and is_diagonal(r):
+        if rows is not None:
+            return selected_sequential_update(x_pred, p_pred, z, rows, r)
+        return sequential_update(x_pred, p_pred, z, h, r)
+    present = ~np.isnan(z[:, 0])
+    if not present.all():
+        if not present.any():
+            return x_pred, p_pred
+        z, h, r = z[present], h[present], r[np.ix_(present, present)]
+        rows = None if rows is None else rows[present]
+    if rows is None:
+        P_xy = p_pred @ np.transpose(h)
+        return kalman_update(x_pred, p_pred, z, h @ x_pred, h @ P_xy + r, P_xy)
+    P_xy = p_pred[:, rows]
+    return kalman_update(x_pred, p_pred, z, x_pred[rows], P_xy[rows] + r, P_xy)
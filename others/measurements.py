@@ -0,0 +1,18 @@
+# measurement source shared by the filter scripts
+
+# the needed csv columns are read once into contiguous float arrays, so the
+# filter loop indexes plain numpy rows instead of going through pandas per sample
+
+import numpy as np
+import pandas as pd
+
+
+# read the named columns of a csv log, returns a dict of contiguous float arrays
+def load_columns(path, names):
+    data = pd.read_csv(path, usecols=names)
+    return {name: np.ascontiguousarray(data[name].to_numpy(dtype=float)) for name in names}
+
+
+# stack the named channels into an (N x m) measurement matrix, one row per sample
+def measurement_matrix(columns, names):
+    return np.ascontiguousarray(np.column_stack([columns[name] for name in names]))
@@ -0,0 +1,122 @@
+# motion models shared by the filter scripts
+
+# x holds the state along its first axis, so a single state (n, 1), a point set
+# (n, 2n) or a flattened batch of point sets (n, K * 2n) are all propagated at once
+
+# the CT and CHCV models run the code generated from others/jacobian.py, which
+# numba compiles into a loop over the points without temporary arrays when it
+# is installed and which is plain vectorized numpy otherwise. the CTRV and CTRA
+# arc is written out by hand below so it stays finite at zero yaw rate
+
+# CTRV and CTRA are affine in every state but yaw, velocity and yaw rate, their
+# linear part a and the chord added to the position are used by the partially
+# nonlinear cubature prediction
+
+import math
+
+import numpy as np
+
+from others.generated import ct as ct_code
+from others.generated import chcv as chcv_code
+
+# yaw rate [rad/s] below which sin(u)/u of the arc takes its series 1 - u**2/6
+turn_threshold = 1e-4
+
+# states the CTRV and CTRA models are nonlinear in: yaw, velocity, yaw rate
+arc_states = slice(2, 5)
+
+# states the chord is added to: x-y position
+chord_states = slice(0, 2)
+
+
+# position and yaw after an arc of dt seconds, written into rows 0-2 of out. the chord is
+#   v * dt * sinc(w * dt / 2) * [cos, sin](yaw + w * dt / 2)
+# so every point evaluates one sin and one cos of the mid yaw and one sin for sinc,
+# and no yaw rate is divided by. masked evaluation picks the series near w = 0
+def arc(x, dt, out):
+    half = x[4] * (dt / 2)
+    small = np.abs(x[4]) < turn_threshold
+    safe = np.where(small, 1.0, half)
+    step = x[3] * dt * np.where(small, 1.0 - half * half / 6.0, np.sin(safe) / safe)
+    mid = x[2] + half
+    out[0] = x[0] + step * np.cos(mid)
+    out[1] = x[1] + step * np.sin(mid)
+    out[2] = mid + half
+    return out
+
+
+# loop form of arc for numba
+def arc_kernel(x, dt, out):
+    for k in range(np.shape(x)[1]):
+        half = x[4, k] * (dt / 2)
+        if abs(x[4, k]) < turn_threshold:
+            sinc = 1.0 - half * half / 6.0
+        else:
+            sinc = math.sin(half) / half
+        step = x[3, k] * dt * sinc
+        mid = x[2, k] + half
+        out[0, k] = x[0, k] + step * math.cos(mid)
+        out[1, k] = x[1, k] + step * math.sin(mid)
+        out[2, k] = mid + half
+    return out
+
+
+# chord of arc for one point given as floats, the nonlinear part of CTRV and CTRA
+def chord(yaw, v, w, dt):
+    half = w * (dt / 2)
+    sinc = 1.0 - half * half / 6.0 if abs(w) < turn_threshold else math.sin(half) / half
+    step = v * dt * sinc
+    mid = yaw + half
+    return step * math.cos(mid), step * math.sin(mid)
+
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    arc = njit(cache=True)(arc_kernel)
+
+
+# CTRV motion model, state: x-y position, yaw, velocity, yaw rate, written into out if given
+def ctrv(x, dt, out=None):
+    out = arc(x, dt, np.empty(np.shape(x)) if out is None else out)
+    out[3] = x[3]
+    out[4] = x[4]
+    return out
+
+
+# CTRA motion model, state: x-y position, yaw, velocity, yaw rate, acceleration,
+# written into out if given
+def ctra(x, dt, out=None):
+    out = arc(x, dt, np.empty(np.shape(x)) if out is None else out)
+    out[3] = x[3] + x[5] * dt
+    out[4] = x[4]
+    out[5] = x[5]
+    return out
+
+
+# linear part of the CTRV model in the states outside arc_states
+def ctrv_linear(dt):
+    a = np.eye(5)
+    a[2, 4] = dt
+    return a
+
+
+# linear part of the CTRA model in the states outside arc_states
+def ctra_linear(dt):
+    a = np.eye(6)
+    a[2, 4] = dt
+    a[3, 5] = dt
+    return a
+
+
+# CT motion model, state: x-y position, velocity, yaw, yaw rate
+def ct(x, dt):
+    return ct_code.f(x, dt)
+
+
+# CHCV motion model, state: x-y position, yaw, velocity
+def chcv(x, dt):
+    return chcv_code.f(x, dt)
@@ -0,0 +1,161 @@
+# parallel in time kalman filter and rauch-tung-striebel smoother for offline logs
+
+# each sample becomes an element of an associative operator (sarkka and garcia-fernandez,
+# temporal parallelization of bayesian smoothers, 2021), so the filter and the smoother
+# are prefix scans over the whole log. the log is split into blocks, the blocks are
+# scanned in a process pool and the block results are joined with the running prefix
+
+# the filter scans the means only. the gains and filtered covariances do not depend on z
+# and come from the riccati recursion of the small n x n matrices, which stops once the
+# gain no longer changes and holds it. the information form elements of the paper fuse
+# an information matrix that grows without bound with an almost singular covariance
+# and lose about 1e-3 m over 20k samples for a mode of a that q does not drive
+
+# elements are tuples of stacked arrays with the sample along the first axis, vectors
+# are kept as (N, n, 1) columns so every operation is a batched matrix product
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from others.kalman_update import kalman_gain
+
+
+def transpose(m):
+    return np.swapaxes(m, -1, -2)
+
+
+# kalman gains (N x n x m) and filtered covariances (N x n x n) of the time invariant
+# model from p_0 over N samples, computed as the sequential filter does. once the gain
+# changes by less than tol relative between two steps it is held for the rest of the log
+def filter_gains(a, q, h, r, p_0, N, tol=1e-14):
+    K = np.empty((N, np.shape(a)[0], np.shape(h)[0]))
+    P = np.empty((N,) + np.shape(a))
+    p = p_0
+    for i in range(N):
+        p_pred = a @ p @ np.transpose(a) + q
+        P_xy = p_pred @ np.transpose(h)
+        K[i] = kalman_gain(P_xy, h @ P_xy + r)
+        p = P[i] = p_pred - K[i] @ np.transpose(P_xy)
+        if i > 0 and np.max(np.abs(K[i] - K[i - 1])) <= tol * np.max(np.abs(K[i])):
+            K[i + 1:] = K[i]
+            P[i + 1:] = P[i]
+            break
+    return K, P
+
+
+# filtering elements (A, b) of the affine mean recursion x_k = A_k @ x_{k-1} + b_k
+# with the gains K, z is (N x m). the first element carries the prior mean x_0
+def filtering_elements(a, h, K, x_0, z):
+    N = np.shape(z)[0]
+    A = (np.eye(np.shape(a)[0]) - K @ h) @ a
+    b = K @ np.reshape(z, (N, -1, 1))
+    b[0] += A[0] @ x_0
+    A[0] = 0.0
+    return A, b
+
+
+# associative operator of the filter, ei is earlier in time than ej
+def combine_filtering(ei, ej):
+    A_i, b_i = ei
+    A_j, b_j = ej
+    return A_j @ A_i, A_j @ b_i + b_j
+
+
+# smoothing elements (E, g, L) from the filtered means (N x n) and covariances (N x n x n)
+def smoothing_elements(a, q, x_filt, p_filt):
+    N, n = np.shape(x_filt)
+    m = np.reshape(x_filt, (N, n, 1))
+    p_pred = a @ p_filt @ np.transpose(a) + q
+    E = transpose(np.linalg.solve(p_pred, a @ p_filt))
+    g = m - E @ a @ m
+    L = p_filt - E @ a @ p_filt
+    E[-1] = 0.0
+    g[-1] = m[-1]
+    L[-1] = p_filt[-1]
+    return E, g, L
+
+
+# associative operator of the smoother, ei is earlier in time than ej
+def combine_smoothing(ei, ej):
+    E_i, g_i, L_i = ei
+    E_j, g_j, L_j = ej
+    return (E_i @ E_j,
+            E_i @ g_j + g_i,
+            E_i @ L_j @ transpose(E_i) + L_i)
+
+
+def take(elements, index):
+    return tuple(e[index] for e in elements)
+
+
+def concatenate(parts):
+    return tuple(np.concatenate(e) for e in zip(*parts))
+
+
+# vectorized inclusive scan of one block, log2(N) batched passes
+def scan_block(combine, elements, reverse=False):
+    if reverse:
+        elements = take(elements, slice(None, None, -1))
+    N = np.shape(elements[0])[0]
+    offset = 1
+    while offset < N:
+        head = take(elements, slice(0, offset))
+        if reverse:
+            tail = combine(take(elements, slice(offset, None)), take(elements, slice(0, N - offset)))
+        else:
+            tail = combine(take(elements, slice(0, N - offset)), take(elements, slice(offset, None)))
+        elements = concatenate((head, tail))
+        offset *= 2
+    if reverse:
+        elements = take(elements, slice(None, None, -1))
+    return elements
+
+
+def scan_block_args(args):
+    return scan_block(*args)
+
+
+# inclusive scan over the whole log, blocks run in a pool of workers processes,
+# reverse scans from the end of the log as the smoother needs
+def associative_scan(combine, elements, workers=None, reverse=False):
+    N = np.shape(elements[0])[0]
+    workers = workers or os.cpu_count() or 1
+    bounds = np.linspace(0, N, min(workers, N) + 1).astype(int)
+    blocks = [take(elements, slice(i, j)) for i, j in zip(bounds[:-1], bounds[1:])]
+    if len(blocks) == 1:
+        return scan_block(combine, elements, reverse)
+    with ProcessPoolExecutor(max_workers=len(blocks)) as pool:
+        scanned = list(pool.map(scan_block_args, [(combine, block, reverse) for block in blocks]))
+
+    # join the blocks in scan order with the running prefix of the previous blocks
+    order = range(len(scanned) - 1, -1, -1) if reverse else range(len(scanned))
+    prefix = None
+    for i in order:
+        total = take(scanned[i], slice(0, 1) if reverse else slice(-1, None))
+        if prefix is not None:
+            if reverse:
+                scanned[i] = combine(scanned[i], prefix)
+                prefix = combine(total, prefix)
+            else:
+                scanned[i] = combine(prefix, scanned[i])
+                prefix = combine(prefix, total)
+        else:
+            prefix = total
+    return concatenate(scanned)
+
+
+# filtered means (N x n) and covariances (N x n x n) of the sequential predict/update
+# of the linear scripts from x_0, p_0 over z (N x m), equal up to rounding
+def parallel_kalman_filter(a, q, h, r, x_0, p_0, z, workers=None):
+    K, P = filter_gains(a, q, h, r, p_0, np.shape(z)[0])
+    _, b = associative_scan(combine_filtering, filtering_elements(a, h, K, x_0, z), workers)
+    return b[:, :, 0], P
+
+
+# rauch-tung-striebel smoothed means (N x n) and covariances (N x n x n)
+def parallel_rts_smoother(a, q, x_filt, p_filt, workers=None):
+    _, g, L = associative_scan(combine_smoothing,
+                               smoothing_elements(a, q, x_filt, p_filt), workers, reverse=True)
+    return g[:, :, 0], L
@@ -0,0 +1,59 @@
+# vectorized rauch-tung-striebel smoother for the linear and cubature filters
+
+# the backward pass
+#   G_k   = p_k @ a.T @ inv(p_pred_k+1)
+#   x_s_k = x_k + G_k @ (x_s_k+1 - x_pred_k+1)
+#   p_s_k = p_k + G_k @ (p_s_k+1 - p_pred_k+1) @ G_k.T
+# is affine in the smoothed moments of step k+1, so every gain is solved in one
+# batched call on the (N x n x n) stacks and the recursion is evaluated as a
+# reverse associative scan in log2(N) batched passes instead of a loop over steps
+
+# row k of the stacks holds the prediction that led to step k and the filtered
+# moments of step k, the prediction of row 0 is never used. the cubature smoother
+# replaces p_k @ a.T with the cross covariance recorded by the forward pass
+
+import numpy as np
+
+from others.parallel_kalman import combine_smoothing, scan_block, transpose
+
+
+# one step predictions of stacked means (N x n) and covariances (N x n x n)
+def predict_stack(a, q, x, p):
+    return x @ np.transpose(a), a @ p @ np.transpose(a) + q
+
+
+# smoother gains G_k for k = 0 .. N-2, p_pred_k+1 is symmetric so G_k.T solves
+# p_pred_k+1 @ G_k.T = a @ p_k
+def smoother_gains(a, p_pred, p_filt):
+    return transpose(np.linalg.solve(p_pred[1:], a @ p_filt[:-1]))
+
+
+# cubature smoother gains G_k = cross_k+1 @ inv(p_pred_k+1) for k = 0 .. N-2
+def cubature_smoother_gains(p_pred, cross):
+    return transpose(np.linalg.solve(p_pred[1:], transpose(cross[1:])))
+
+
+# backward pass with the gains G (N-1 x n x n) of every step but the last
+def backward_pass(G, x_pred, p_pred, x_filt, p_filt):
+    N, n = np.shape(x_filt)
+    m = np.reshape(x_filt, (N, n, 1))
+    E = np.zeros((N, n, n))
+    E[:-1] = G
+    g = m.copy()
+    g[:-1] -= G @ np.reshape(x_pred[1:], (N - 1, n, 1))
+    L = p_filt.copy()
+    L[:-1] -= G @ p_pred[1:] @ transpose(G)
+    _, g, L = scan_block(combine_smoothing, (E, g, L), reverse=True)
+    return g[:, :, 0], (L + transpose(L)) / 2
+
+
+# smoothed means (N x n) and covariances (N x n x n) from the recorded
+# predicted and filtered moments of the linear kalman filter
+def rts_smoother(a, x_pred, p_pred, x_filt, p_filt):
+    return backward_pass(smoother_gains(a, p_pred, p_filt), x_pred, p_pred, x_filt, p_filt)
+
+
+# smoothed means and covariances of the cubature kalman filter, cross_k is the
+# cross covariance between the filtered state k-1 and the prediction of step k
+def cubature_rts_smoother(x_pred, p_pred, x_filt, p_filt, cross):
+    return backward_pass(cubature_smoother_gains(p_pred, cross), x_pred, p_pred, x_filt, p_filt)
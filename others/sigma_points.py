@@ -1,26 +1,92 @@
+# cubature point generation shared by the cubature kalman filter scripts
+
+# a rule integrates over a standard normal in n dimensions with unit points XI
+# (n x K) and weights W (1 x K). the rule is picked by name per model:
+#   'third'          third degree spherical-radial rule, 2n points of weight 1/(2n)
+#   'fifth'          fifth degree spherical-radial rule, 2n**2 + 1 points, the
+#                    axis weights are negative for n > 4
+#   'gauss_hermite'  tensor product gauss-hermite rule, gauss_hermite_order**n points
+# point sets are built once per (rule, n) and cached read only, the gauss-hermite
+# key also holds gauss_hermite_order so changing it builds a new set
+
+import itertools
 import math
 import numpy as np
-from scipy.linalg import sqrtm
+
+# points per axis of the gauss-hermite rule, exact for polynomials up to degree 2 * order - 1
+gauss_hermite_order = 3
+
+# unit point sets keyed by (rule, state dimension) or (rule, state dimension, order)
+unit_point_cache = {}
+
+
+# third degree rule, sqrt(n) * [I, -I] with weights 1/(2n)
+def third_degree_points(n):
+    XI = math.sqrt(n) * np.eye(n)
+    return np.hstack((XI, -XI)), np.full((1, 2*n), 1/(2*n))
+
+
+# fifth degree rule, the center, sqrt(n + 2) * [I, -I] and the 2n(n - 1) points
+# sqrt(n + 2) * (+-e_i +- e_j) / sqrt(2) for i < j
+def fifth_degree_points(n):
+    I = np.eye(n)
+    pairs = [s_i * I[i] + s_j * I[j] for i, j in itertools.combinations(range(n), 2)
+             for s_i, s_j in ((1, 1), (1, -1), (-1, 1), (-1, -1))]
+    XI = np.column_stack([np.zeros(n)] + list(I) + list(-I) + [v / math.sqrt(2) for v in pairs])
+    W = np.concatenate(([2 / (n + 2)], np.full(2*n, (4 - n) / (2 * (n + 2)**2)),
+                        np.full(len(pairs), 1 / (n + 2)**2)))
+    return math.sqrt(n + 2) * XI, W[None, :]
+
+
+# tensor product of the gauss_hermite_order point gauss-hermite rule for a standard normal
+def gauss_hermite_points(n):
+    nodes, weights = np.polynomial.hermite_e.hermegauss(gauss_hermite_order)
+    weights = weights / math.sqrt(2 * math.pi)
+    index = np.array(list(itertools.product(range(gauss_hermite_order), repeat=n))).T
+    return nodes[index], np.prod(weights[index], axis=0)[None, :]
+
+
+rules = {'third': third_degree_points, 'fifth': fifth_degree_points, 'gauss_hermite': gauss_hermite_points}
+
+
+# unit points and weights of rule in n dimensions, built once per key
+def unit_points(n, rule='third'):
+    key = (rule, n, gauss_hermite_order) if rule == 'gauss_hermite' else (rule, n)
+    if key not in unit_point_cache:
+        XI, W = rules[rule](n)
+        XI.setflags(write=False)
+        W.setflags(write=False)
+        unit_point_cache[key] = (XI, W)
+    return unit_point_cache[key]
+
+
+# lower triangular square root of p, falls back to an eigen factor if p is not positive definite
+def factor(p):
+    try:
+        return np.linalg.cholesky(p)
+    except np.linalg.LinAlgError:
+        d, V = np.linalg.eigh((p + np.transpose(p)) / 2)
+        return V * np.sqrt(np.clip(d, 0.0, None))
+
+
+# cubature points around x from a square root s of the covariance, a factor
+# with fewer columns than states spreads points along its columns only
+def sigma_from_factor(x, s, rule='third'):
+    XI, W = unit_points(np.shape(s)[1], rule)
+    return x + s @ XI, W
 
 
-def sigma(x, p):
-    n = np.shape(x)[0]
-    SP = np.zeros((n, 2*n))
-    W = np.zeros((1, 2*n))
-    for i in range(n):
-        SD = sqrtm(p)
-        SP[:, i] = (x + (math.sqrt(n) * SD[:, i]).reshape((5, 1))).flatten()
-        SP[:, i+n] = (x - (math.sqrt(n) * SD[:, i]).reshape((5, 1))).flatten()
-        W[:, i] = 1/(2*n)
-        W[:, i+n] = W[:, i]
-    return SP.astype(float), W.astype(float)
+# generate sigma points
+def sigma(x, p, rule='third'):
+    return sigma_from_factor(x, factor(p), rule)
 
 
-x = np.ones((5, 1))
-p = np.eye(5)
+if __name__ == '__main__':
+    x = np.ones((5, 1))
+    p = np.eye(5)
 
-[SP, W] = sigma(x, p)
-print(SP)
-print(W)
+    [SP, W] = sigma(x, p)
+    print(SP)
+    print(W)
 
-print('end')
+    print('end')
@@ -0,0 +1,59 @@
+# square root cubature kalman filter shared by the cubature kalman filter scripts
+
+# the covariance is carried as its lower triangular square root s (p = s @ s.T),
+# updated by qr triangularization so p is never formed or re-factored
+
+import numpy as np
+from scipy.linalg import solve_triangular
+
+from others.kalman_update import selector_rows
+from others.sigma_points import sigma_from_factor
+
+
+# lower triangular s with s @ s.T = a @ a.T, from the qr decomposition of a.T
+def tria(a):
+    return np.transpose(np.linalg.qr(np.transpose(a), mode='r'))
+
+
+# square root cubature kalman filter nonlinear prediction step, sq is the square root of q
+def sqrt_cubature_prediction(x, s, f, sq):
+    SP, W = sigma_from_factor(x, s)
+    Y = f(SP)
+    x_pred = Y @ np.transpose(W)
+    s_pred = tria(np.hstack(((Y - x_pred) * np.sqrt(W), sq)))
+    return x_pred, s_pred
+
+
+# square root cubature kalman filter nonlinear update step, sr is the square root of r
+# a matrix h is a linear measurement model and is applied to s_pred directly,
+# a selector h picks the rows of x_pred and s_pred. channels that are NaN in z are
+# missing and their rows are dropped from the innovation and from sr, the rows of sr
+# still square to the noise covariance of the channels left
+def sqrt_cubature_update(x_pred, s_pred, z, h, sr):
+    if isinstance(h, np.ndarray):
+        rows = selector_rows(h)
+        X_c = s_pred
+        if rows is None:
+            y_k = h @ x_pred
+            Y_c = h @ s_pred
+        else:
+            y_k = x_pred[rows]
+            Y_c = s_pred[rows]
+    else:
+        SP, W = sigma_from_factor(x_pred, s_pred)
+        Y = h(SP)
+        y_k = Y @ np.transpose(W)
+        X_c = (SP - x_pred) * np.sqrt(W)
+        Y_c = (Y - y_k) * np.sqrt(W)
+    present = ~np.isnan(z[:, 0])
+    if not present.all():
+        if not present.any():
+            return x_pred, s_pred
+        z, y_k, Y_c, sr = z[present], y_k[present], Y_c[present], sr[present]
+    s_zz = tria(np.hstack((Y_c, sr)))
+    P_xy = X_c @ np.transpose(Y_c)
+    k = np.transpose(solve_triangular(s_zz, solve_triangular(
+        s_zz, np.transpose(P_xy), lower=True), lower=True, trans='T'))
+    x_upd = x_pred + k @ (z - y_k)
+    s_upd = tria(np.hstack((X_c - k @ Y_c, k @ sr)))
+    return x_upd, s_upd
@@ -0,0 +1,77 @@
+# bounded state history for out of sequence measurements
+
+# the last capacity filter steps are kept in preallocated ring arrays: the time,
+# the posterior mean and covariance (or its square root) and the stacked update
+# (z, h, r) applied at that step. a measurement stamped before the newest step
+# rewinds to the newest step at or before its time stamp, is applied there and
+# the later steps are replayed on top of it, so late fixes need no fixed delay
+# of the whole pipeline
+
+import numpy as np
+
+
+class StateHistory:
+    # n states, at most m_max measurement rows per step
+    def __init__(self, n, m_max, capacity=64):
+        self.t = np.zeros(capacity)
+        self.x = np.zeros((capacity, n, 1))
+        self.p = np.zeros((capacity, n, n))
+        self.z = np.zeros((capacity, m_max, 1))
+        self.h = np.zeros((capacity, m_max, n))
+        self.r = np.zeros((capacity, m_max, m_max))
+        self.m = np.zeros(capacity, dtype=int)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # ring index of the j-th stored step, 0 is the oldest and -1 the newest
+    def index(self, j):
+        return (self.head - self.size + j % self.size) % len(self.t)
+
+    # record a filter step, the oldest step is overwritten when the ring is full
+    def push(self, t, x, p, z, h, r):
+        i = self.head
+        m = np.shape(z)[0]
+        self.t[i] = t
+        self.x[i] = x
+        self.p[i] = p
+        self.z[i, :m] = z
+        self.h[i, :m] = h
+        self.r[i, :m, :m] = r
+        self.m[i] = m
+        self.head = (i + 1) % len(self.t)
+        self.size = min(self.size + 1, len(self.t))
+
+    # time, mean and covariance of the newest step
+    def latest(self):
+        i = self.index(-1)
+        return self.t[i], self.x[i], self.p[i]
+
+    # stacked update of the j-th stored step
+    def update_of(self, j):
+        i = self.index(j)
+        m = self.m[i]
+        return self.z[i, :m], self.h[i, :m], self.r[i, :m, :m]
+
+    # apply the update z, h, r stamped t that arrived after later steps were filtered,
+    # step(x, p, z, dt, h, r) is the filter predict and update. returns False and
+    # leaves the history unchanged if t is older than the history or more than
+    # max_rewind steps would have to be replayed
+    def apply_late(self, step, t, z, h, r, max_rewind):
+        times = self.t[[self.index(j) for j in range(self.size)]]
+        j = np.searchsorted(times, t, side='right') - 1
+        if j < 0 or self.size - 1 - j > max_rewind:
+            return False
+        replay = [(self.t[self.index(k)],) + self.update_of(k) for k in range(j + 1, self.size)]
+        replay = [(t_k, z_k.copy(), h_k.copy(), r_k.copy()) for t_k, z_k, h_k, r_k in replay]
+        i = self.index(j)
+        t_j, x, p = self.t[i], self.x[i].copy(), self.p[i].copy()
+        self.head = (i + 1) % len(self.t)
+        self.size = j + 1
+        for t_k, z_k, h_k, r_k in [(t, z, h, r)] + replay:
+            x, p = step(x, p, z_k, t_k - t_j, h_k, r_k)
+            self.push(t_k, x, p, z_k, h_k, r_k)
+            t_j = t_k
+        return True
@@ -0,0 +1,67 @@
+# steady state kalman gain for the time invariant linear filters
+
+# the predicted covariance solves the discrete algebraic riccati equation
+#   p = a @ p @ a.T - a @ p @ h.T @ inv(h @ p @ h.T + r) @ h @ p @ a.T + q
+# once the gain k is known each filter step is x = a_ss @ x + k @ z
+
+# the steady state filter is only used if (a, q) is stabilizable, a mode of a that
+# q does not drive leaves a_ss with an eigenvalue on the unit circle and the filter
+# would never forget its error along it. the riccati solvers still return a solution
+# for such models, so the closed loop is checked and the mode is refused
+
+import numpy as np
+from scipy.linalg import solve_discrete_are
+
+from others.kalman_update import kalman_gain
+
+
+# solve the filter riccati equation by the structured doubling algorithm, for models
+# with undriven modes on the unit circle where solve_discrete_are gives up
+def riccati_doubling(a, q, h, r, tol=1e-12, max_iter=64):
+    n = np.shape(a)[0]
+    A = np.transpose(a)
+    G = np.transpose(h) @ np.linalg.solve(r, h)
+    H = q
+    for _ in range(max_iter):
+        W = np.linalg.inv(np.eye(n) + G @ H)
+        H_next = H + np.transpose(A) @ H @ W @ A
+        G = G + A @ W @ G @ np.transpose(A)
+        A = A @ W @ A
+        if np.max(np.abs(H_next - H)) <= tol * np.max(np.abs(H_next)):
+            return (H_next + np.transpose(H_next)) / 2
+        H = H_next
+    raise np.linalg.LinAlgError('riccati doubling did not converge')
+
+
+# steady state predicted covariance of the linear model a, q, h, r
+def steady_state_covariance(a, q, h, r):
+    try:
+        return solve_discrete_are(np.transpose(a), np.transpose(h), q, r)
+    except (np.linalg.LinAlgError, ValueError):
+        return riccati_doubling(a, q, h, r)
+
+
+# steady state kalman gain k, closed loop transition a_ss = (I - k @ h) @ a and
+# filtered covariance p_ss. raises ValueError if the spectral radius of a_ss is
+# within margin of one, margin covers the error of the riccati solution on the unit circle
+def steady_state_gain(a, q, h, r, margin=1e-4):
+    p_pred = steady_state_covariance(a, q, h, r)
+    P_xy = p_pred @ np.transpose(h)
+    k = kalman_gain(P_xy, h @ P_xy + r)
+    p_ss = p_pred - k @ np.transpose(P_xy)
+    a_ss = (np.eye(np.shape(a)[0]) - k @ h) @ a
+    radius = np.max(np.abs(np.linalg.eigvals(a_ss)))
+    if radius >= 1.0 - margin:
+        raise ValueError('steady state filter is not stable, spectral radius of a_ss is %.9f, '
+                         'q does not drive every mode of a' % radius)
+    return a_ss, k, (p_ss + np.transpose(p_ss)) / 2
+
+
+# kalman gain p @ h.T @ inv(r) of the filtered covariance p
+def filtered_gain(p, h, r):
+    return p @ np.transpose(h) @ np.linalg.inv(r)
+
+
+# true once the gain k is within a relative tol of the steady state gain k_ss
+def has_converged(k, k_ss, tol=1e-4):
+    return np.max(np.abs(k - k_ss)) <= tol * np.max(np.abs(k_ss))
@@ -0,0 +1,49 @@
+# trajectory recorder shared by the filter scripts
+
+# each step is written into one row of a preallocated structured array, the
+# array doubles in size when full, so recording is amortized O(1) per step
+# instead of copying the whole history with np.vstack
+
+import numpy as np
+
+
+class Trajectory:
+    # fields is a list of (name, shape) pairs, e.g. [('x', 6), ('z', 5), ('p', (6, 6))]
+    def __init__(self, fields, capacity=1024):
+        self.dtype = np.dtype([(name, float, shape if isinstance(shape, tuple) else (shape,))
+                               for name, shape in fields])
+        self.data = np.zeros(max(capacity, 1), dtype=self.dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # view of the recorded rows of one field, e.g. trajectory['x'] is (size x 6)
+    def __getitem__(self, name):
+        return self.data[name][:self.size]
+
+    # record one step, values are reshaped to the field shape
+    def append(self, **values):
+        if self.size == len(self.data):
+            data = np.zeros(2 * len(self.data), dtype=self.dtype)
+            data[:self.size] = self.data
+            self.data = data
+        for name, value in values.items():
+            field = self.data[name]
+            field[self.size] = np.reshape(value, field.shape[1:])
+        self.size += 1
+
+    # record many steps at once, values have the steps along their first axis
+    def extend(self, **values):
+        count = len(next(iter(values.values())))
+        capacity = len(self.data)
+        while self.size + count > capacity:
+            capacity *= 2
+        if capacity > len(self.data):
+            data = np.zeros(capacity, dtype=self.dtype)
+            data[:self.size] = self.data
+            self.data = data
+        for name, value in values.items():
+            field = self.data[name]
+            field[self.size:self.size + count] = np.reshape(value, (count,) + field.shape[1:])
+        self.size += count
@@ -0,0 +1,67 @@
+# the parallel in time kalman filter against the sequential predict/update of the
+# linear scripts over a full length log
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from others.discretization import Discretization
+from others.kalman_update import linear_kalman_update
+from others.parallel_kalman import parallel_kalman_filter
+
+dt = 0.01
+N = 20000
+
+# continuous time CV model of linear/KF_CV_cfs.py
+a = np.array([[0.0, 0.0, 1.0, 0.0],
+              [0.0, 0.0, 0.0, 1.0],
+              [0.0, 0.0, 0.0, 0.0],
+              [0.0, 0.0, 0.0, 0.0]])
+h = np.array([[1.0, 0.0, 0.0, 0.0],
+              [0.0, 1.0, 0.0, 0.0]])
+r = np.array([[0.010, 0.0],
+              [0.0, 0.015]])**2
+x_0 = np.zeros((4, 1))
+p_0 = np.eye(4)
+
+
+# noisy x-y positions of a slowly widening loop
+def measurements():
+    rng = np.random.default_rng(0)
+    t = np.arange(N) * dt
+    z = np.column_stack((t * np.sin(t / 20), t * np.cos(t / 15) / 2))
+    return z + rng.normal(size=(N, 2)) * [0.010, 0.015]
+
+
+def sequential_filter(a_d, q_d, z):
+    x, p = x_0, p_0
+    x_filt = np.empty((N, 4))
+    p_filt = np.empty((N, 4, 4))
+    for i in range(N):
+        x, p = a_d @ x, a_d @ p @ np.transpose(a_d) + q_d
+        x, p = linear_kalman_update(x, p, z[i].reshape((-1, 1)), h, r)
+        x_filt[i] = x[:, 0]
+        p_filt[i] = p
+    return x_filt, p_filt
+
+
+def check(gamma, tol):
+    a_d, q_d = Discretization(a, 1e-1 * gamma @ np.transpose(gamma))(dt)
+    z = measurements()
+    x_seq, p_seq = sequential_filter(a_d, q_d, z)
+    for workers in (1, 4):
+        x_par, p_par = parallel_kalman_filter(a_d, q_d, h, r, x_0, p_0, z, workers)
+        assert np.max(np.abs(x_par - x_seq)) < tol
+        assert np.max(np.abs(p_par - p_seq)) < 1e-12
+
+
+# independent x and y noise as in the script, the gain converges and is held
+def test_cv_model():
+    check(np.array([[0.0, 0.0], [0.0, 0.0], [1.0, 0.0], [0.0, 1.0]]), 1e-10)
+
+
+# one noise input shared by x and y leaves a mode of a undriven, the gain never settles
+def test_undriven_mode():
+    check(np.array([[0.0], [0.0], [1.0], [1.0]]), 1e-8)
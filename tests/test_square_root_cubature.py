@@ -0,0 +1,45 @@
+# the square root cubature kalman filter update with missing (NaN) measurement channels
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from others.kalman_update import linear_kalman_update
+from others.square_root_cubature import sqrt_cubature_update
+
+rng = np.random.default_rng(0)
+x_pred = rng.normal(size=(6, 1))
+s_pred = np.linalg.cholesky(np.cov(rng.normal(size=(6, 20))) + 0.1 * np.eye(6))
+hx = np.eye(6)[[0, 1, 3, 4, 5]]
+r = np.diag([0.015, 0.010, 0.01, 0.01, 0.01])**2
+sr = np.linalg.cholesky(r)
+z = rng.normal(size=(5, 1))
+z[2] = np.nan
+
+
+# a matrix h takes the linear square root update and must match the covariance update
+def test_missing_channel_linear():
+    x_upd, s_upd = sqrt_cubature_update(x_pred, s_pred, z, hx, sr)
+    x_ref, p_ref = linear_kalman_update(x_pred, s_pred @ np.transpose(s_pred), z, hx, r)
+    assert not np.isnan(x_upd).any()
+    assert np.allclose(x_upd, x_ref, atol=1e-12)
+    assert np.allclose(s_upd @ np.transpose(s_upd), p_ref, atol=1e-12)
+
+
+# a nonlinear h with a NaN channel equals the update without that channel
+def test_missing_channel_nonlinear():
+    present = [0, 1, 3, 4]
+    x_upd, s_upd = sqrt_cubature_update(x_pred, s_pred, z, lambda x: hx @ x, sr)
+    x_ref, s_ref = sqrt_cubature_update(x_pred, s_pred, z[present], lambda x: hx[present] @ x,
+                                        np.linalg.cholesky(r[np.ix_(present, present)]))
+    assert np.allclose(x_upd, x_ref, atol=1e-12)
+    assert np.allclose(s_upd @ np.transpose(s_upd), s_ref @ np.transpose(s_ref), atol=1e-12)
+
+
+# without any channel the prediction is returned unchanged
+def test_all_channels_missing():
+    x_upd, s_upd = sqrt_cubature_update(x_pred, s_pred, np.full((5, 1), np.nan), hx, sr)
+    assert np.array_equal(x_upd, x_pred)
+    assert np.array_equal(s_upd, s_pred)